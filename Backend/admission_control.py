@@ -0,0 +1,233 @@
+"""
+admission_control.py -
+Admission Control and Load Shedding Module
+Keeps slow LLM routes from starving cheap interactive routes by giving each
+route class its own concurrency limit, a bounded wait queue with a deadline,
+and priority access to the shared worker slots.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from flask import jsonify
+
+
+class RouteClass:
+    """
+    Admission settings for one class of routes
+    """
+
+    def __init__(self, name, max_concurrent, max_queue, queue_slo, priority,
+                 initial_service_time=0.1):
+        """
+        Args:
+            name (str): Route class name, e.g. 'interactive' or 'generation'
+            max_concurrent (int): Requests of this class allowed to run at once
+            max_queue (int): Requests of this class allowed to wait for a slot
+            queue_slo (float): Longest acceptable queue wait in seconds
+            priority (int): Lower number is served first when slots free up
+            initial_service_time (float): Service time estimate (seconds)
+                                          used until real timings are observed
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_slo = queue_slo
+        self.priority = priority
+
+        self.in_flight = 0
+        self.waiters = deque()
+        self.avg_service_time = initial_service_time
+
+        self.admitted = 0
+        self.completed = 0
+        self.shed_queue_full = 0
+        self.shed_slo = 0
+        self.shed_deadline = 0
+
+    def stats(self):
+        """Return a JSON-serializable snapshot of this class' counters"""
+        return {
+            'priority': self.priority,
+            'maxConcurrent': self.max_concurrent,
+            'maxQueue': self.max_queue,
+            'queueSloSeconds': self.queue_slo,
+            'inFlight': self.in_flight,
+            'queued': len(self.waiters),
+            'avgServiceSeconds': round(self.avg_service_time, 4),
+            'admitted': self.admitted,
+            'completed': self.completed,
+            'shed': {
+                'queueFull': self.shed_queue_full,
+                'sloExceeded': self.shed_slo,
+                'deadline': self.shed_deadline
+            }
+        }
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is shed instead of admitted
+    """
+
+    def __init__(self, route_class, reason, retry_after):
+        super().__init__(f"{route_class} request shed: {reason}")
+        self.route_class = route_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Grants worker slots to requests by route class and priority
+    """
+
+    # Weight of the newest sample in the service time moving average
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, total_slots, route_classes):
+        """
+        Args:
+            total_slots (int): Worker slots shared by all route classes
+                               (usually the number of server threads)
+            route_classes (list): RouteClass instances to manage
+        """
+        self.total_slots = total_slots
+        self.classes = {rc.name: rc for rc in route_classes}
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, class_name):
+        """
+        Wait for a slot for the given route class
+
+        Args:
+            class_name (str): Name of a configured route class
+
+        Returns:
+            float: Monotonic timestamp when the slot was granted
+
+        Raises:
+            AdmissionRejected: If the request is shed
+        """
+        rc = self.classes[class_name]
+        with self._cond:
+            if not rc.waiters and self._can_run(rc) and not self._outranked(rc):
+                return self._grant(rc)
+
+            if len(rc.waiters) >= rc.max_queue:
+                rc.shed_queue_full += 1
+                raise AdmissionRejected(
+                    rc.name, 'queue full', self._retry_after(rc, len(rc.waiters)))
+
+            expected_wait = self._expected_wait(rc, len(rc.waiters))
+            if expected_wait > rc.queue_slo:
+                rc.shed_slo += 1
+                raise AdmissionRejected(rc.name, 'queue wait would exceed SLO',
+                                        math.ceil(expected_wait))
+
+            ticket = object()
+            rc.waiters.append(ticket)
+            deadline = time.monotonic() + rc.queue_slo
+            try:
+                while not (rc.waiters[0] is ticket and self._can_run(rc)
+                           and not self._outranked(rc)):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        rc.shed_deadline += 1
+                        raise AdmissionRejected(
+                            rc.name, 'queue deadline exceeded',
+                            self._retry_after(rc, len(rc.waiters)))
+                    self._cond.wait(remaining)
+            finally:
+                rc.waiters.remove(ticket)
+                # Waking everyone lets the next waiter (of any class) re-check
+                self._cond.notify_all()
+            return self._grant(rc)
+
+    def release(self, class_name, started_at):
+        """
+        Return a slot and record how long the request held it
+
+        Args:
+            class_name (str): Route class passed to acquire()
+            started_at (float): Value returned by acquire()
+        """
+        rc = self.classes[class_name]
+        elapsed = time.monotonic() - started_at
+        with self._cond:
+            rc.in_flight -= 1
+            self.in_flight -= 1
+            rc.completed += 1
+            rc.avg_service_time += self.EWMA_ALPHA * (elapsed - rc.avg_service_time)
+            self._cond.notify_all()
+
+    def limit(self, class_name):
+        """
+        Decorator that runs a Flask view under admission control
+
+        Shed requests get a 503 with a Retry-After header instead of
+        occupying a worker thread while they wait. A view can also shed
+        itself (e.g. when its upstream is overloaded) by raising AdmissionRejected.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                try:
+                    started_at = self.acquire(class_name)
+                except AdmissionRejected as e:
+                    return self._shed_response(e)
+                try:
+                    return view(*args, **kwargs)
+                except AdmissionRejected as e:
+                    return self._shed_response(e)
+                finally:
+                    self.release(class_name, started_at)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        """Return counters and shedding decisions for the health endpoint"""
+        with self._cond:
+            return {
+                'totalSlots': self.total_slots,
+                'inFlight': self.in_flight,
+                'classes': {name: rc.stats() for name, rc in self.classes.items()}
+            }
+
+    @staticmethod
+    def _shed_response(error):
+        response = jsonify({
+            'success': False,
+            'error': 'Server is busy. Please retry shortly.',
+            'reason': error.reason
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response
+
+    def _can_run(self, rc):
+        return rc.in_flight < rc.max_concurrent and self.in_flight < self.total_slots
+
+    def _outranked(self, rc):
+        """True if a higher-priority class has a waiter that could take the slot"""
+        for other in self.classes.values():
+            if other.priority < rc.priority and other.waiters and self._can_run(other):
+                return True
+        return False
+
+    def _grant(self, rc):
+        rc.in_flight += 1
+        self.in_flight += 1
+        rc.admitted += 1
+        return time.monotonic()
+
+    def _expected_wait(self, rc, position):
+        """Estimate queue wait for a request joining behind `position` waiters"""
+        return (position + 1) * rc.avg_service_time / max(rc.max_concurrent, 1)
+
+    def _retry_after(self, rc, position):
+        return max(1, math.ceil(self._expected_wait(rc, position)))
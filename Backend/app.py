@@ -1,15 +1,31 @@
 # app.py
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
+import logging
 import pickle
 import os
+import time
+import uuid
 import pandas as pd
 import json
 from datetime import datetime
 from dotenv import load_dotenv
 load_dotenv()
-from diet_chart_generator import DietChartGenerator
+from diet_chart_generator import (
+    DietChartGenerator, StubContextCache, StubGenerativeModel
+)
+from admission_control import AdmissionController, AdmissionRejected, RouteClass
+from chart_store import BlockStore, ChartStore
+from model_router import build_default_router
+from food_catalogue import FoodCatalogue, FILTER_COLUMNS, NUMERIC_COLUMNS
+from nutrition_analytics import NutritionAnalytics, COHORT_FIELDS, cohort_profile
+from structured_logging import configure_logging, request_id_var, WarningSampler
+
+configure_logging()
+logger = logging.getLogger('ayurpulse.app')
+# Unknown feature values arrive in bursts from the same client form; log them sampled
+feature_fallback_sampler = WarningSampler(logger, interval=60.0)
 
 # ------------------ near the top, after imports ------------------
 
@@ -44,6 +60,28 @@ except Exception as e:
 app = Flask(__name__)
 CORS(app)
 
+
+@app.before_request
+def assign_request_id():
+    """Tag the request (and every log record it emits) with a request id"""
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_id_token = request_id_var.set(g.request_id)
+
+
+@app.after_request
+def echo_request_id(response):
+    request_id = g.get('request_id')
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+    return response
+
+
+@app.teardown_request
+def clear_request_id(exc):
+    token = g.get('request_id_token')
+    if token is not None:
+        request_id_var.reset(token)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 model_path = os.path.join(BASE_DIR, 'dosha_model.pkl')
 encoder_path = os.path.join(BASE_DIR, 'label_encoders.pkl')
@@ -64,9 +102,32 @@ if os.path.exists(model_path) and os.path.exists(encoder_path):
 else:
     print("⚠️  Warning: ML model files not found. Dosha prediction will not work.")
 
+# Load the food catalogue (FOOD_CATALOGUE_PATH overrides the bundled file)
+try:
+    food_catalogue = FoodCatalogue.from_file()
+    logger.info("Food catalogue loaded", extra=food_catalogue.stats())
+except Exception as e:
+    logger.warning("Failed to load food catalogue", extra={'error': str(e)})
+    food_catalogue = None
+
 # Initialize diet chart generator
 try:
-    diet_generator = DietChartGenerator()
+    # ROUTER_SHED_OVER_BUDGET=1 answers 503 instead of waiting on an over-budget model tier
+    router = build_default_router(shed_over_budget=bool(os.getenv('ROUTER_SHED_OVER_BUDGET')))
+    if os.getenv('USE_STUB_LLM'):
+        # Offline stub for load testing; USE_STUB_LLM_LATENCY simulates slow generations
+        diet_generator = DietChartGenerator(
+            model=StubGenerativeModel(latency=float(os.getenv('USE_STUB_LLM_LATENCY', '0'))),
+            router=router,
+            food_catalogue=food_catalogue,
+            # PROMPT_CONTEXT_CACHE=1 simulates caching the static prompt prefix
+            context_cache=StubContextCache() if os.getenv('PROMPT_CONTEXT_CACHE') else None
+        )
+    else:
+        diet_generator = DietChartGenerator(
+            router=router,
+            food_catalogue=food_catalogue
+        )
     print("✅ Diet Chart Generator initialized successfully!")
 except ValueError as e:
     print(f"⚠️  Warning: {e}")
@@ -74,6 +135,55 @@ except ValueError as e:
 except Exception as e:
     print(f"⚠️  Warning: Failed to initialize Diet Chart Generator: {e}")
 
+# Admission control: interactive routes (dosha prediction, patient records) are
+# served ahead of slow LLM generation routes and never queue behind them
+admission = AdmissionController(
+    total_slots=int(os.getenv('ADMISSION_TOTAL_SLOTS', '8')),
+    route_classes=[
+        RouteClass('interactive',
+                   max_concurrent=int(os.getenv('ADMISSION_INTERACTIVE_CONCURRENCY', '8')),
+                   max_queue=int(os.getenv('ADMISSION_INTERACTIVE_QUEUE', '32')),
+                   queue_slo=float(os.getenv('ADMISSION_INTERACTIVE_SLO', '1.0')),
+                   priority=0,
+                   initial_service_time=0.05),
+        RouteClass('generation',
+                   max_concurrent=int(os.getenv('ADMISSION_GENERATION_CONCURRENCY', '4')),
+                   max_queue=int(os.getenv('ADMISSION_GENERATION_QUEUE', '8')),
+                   queue_slo=float(os.getenv('ADMISSION_GENERATION_SLO', '30.0')),
+                   priority=1,
+                   initial_service_time=15.0)
+    ]
+)
+
+# Diet charts are stored deduplicated by content; set CHART_STORE_DIR to persist them
+chart_store = ChartStore(BlockStore(
+    directory=os.getenv('CHART_STORE_DIR'),
+    cache_size=int(os.getenv('CHART_STORE_CACHE_BLOCKS', '4096'))
+))
+
+# Saved charts are flattened into columnar arrays with per-cohort rollups
+nutrition_analytics = NutritionAnalytics(food_catalogue)
+
+
+def ingest_chart(patient_id, version):
+    """
+    Feed a stored chart version to analytics under the cohort recorded at save time
+
+    Analytics is derived data, so a chart it cannot flatten is logged and
+    skipped instead of failing the write that stored it.
+    """
+    try:
+        nutrition_analytics.add_chart(patient_id, chart_store.get_chart(patient_id, version),
+                                      chart_store.attributes(patient_id), version)
+    except Exception as e:
+        logger.warning("Chart analytics ingest failed", exc_info=True,
+                       extra={'patientId': patient_id, 'chartVersion': version, 'error': str(e)})
+
+
+# Rebuild analytics from charts persisted by a previous run
+for stored_id in chart_store.chart_ids():
+    ingest_chart(stored_id, chart_store.version_count(stored_id))
+
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -82,12 +192,19 @@ def health_check():
         'status': 'running',
         'ml_model_loaded': model is not None,
         'diet_generator_ready': diet_generator is not None,
+        'admission': admission.stats(),
+        'chart_store': chart_store.stats(),
+        'model_routing': diet_generator.router.stats() if diet_generator else None,
+        'prompts': diet_generator.prompt_stats() if diet_generator else None,
+        'food_catalogue': food_catalogue.stats() if food_catalogue else None,
+        'nutrition_analytics': nutrition_analytics.stats(),
         'timestamp': datetime.now().isoformat()
     }
     return jsonify(status)
 
 
 @app.route('/predict', methods=['POST'])
+@admission.limit('interactive')
 def predict():
     """
     Predict user's Ayurvedic dosha based on physical and behavioral characteristics
@@ -116,7 +233,11 @@ def predict():
             try:
                 encoded_val = label_encoders[feature].transform([val])[0]
             except Exception as e:
-                print(f"⚠️ Mapping failed for {feature} with value '{val}'. Error: {e}")
+                feature_fallback_sampler.warning(
+                    f"unknown-feature:{feature}",
+                    "Unknown feature value; falling back to first known class",
+                    feature=feature, value=val[:50], error=str(e)
+                )
                 # Fallback to first known class for that feature
                 encoded_val = label_encoders[feature].transform([label_encoders[feature].classes_[0]])[0]
             processed_features.append(encoded_val)
@@ -138,7 +259,7 @@ def predict():
         }), 500
         
     except Exception as e:
-        print(f"Error in predict endpoint: {e}")
+        logger.exception("Error in predict endpoint")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -146,6 +267,7 @@ def predict():
 
 
 @app.route('/generate-diet-chart', methods=['POST'])
+@admission.limit('generation')
 def generate_diet_chart():
     """
     Generate personalized 7-day diet chart using Gemini API
@@ -182,15 +304,19 @@ def generate_diet_chart():
             'dietChart': diet_chart
         })
         
+    except AdmissionRejected:
+        # Shed by the model router; admission control answers 503 with Retry-After
+        raise
+        
     except ValueError as e:
-        print(f"Validation Error: {e}")
+        logger.warning("Diet chart validation error", extra={'error': str(e)})
         return jsonify({
             'success': False,
             'error': f'Validation error: {str(e)}'
         }), 400
         
     except json.JSONDecodeError as e:
-        print(f"JSON Parse Error: {e}")
+        logger.warning("Diet chart JSON parse error", extra={'error': str(e)})
         return jsonify({
             'success': False,
             'error': 'Failed to parse diet chart from AI. Please try again.',
@@ -198,7 +324,7 @@ def generate_diet_chart():
         }), 500
         
     except Exception as e:
-        print(f"Error generating diet chart: {e}")
+        logger.exception("Error generating diet chart")
         return jsonify({
             'success': False,
             'error': f'Failed to generate diet chart: {str(e)}'
@@ -206,12 +332,14 @@ def generate_diet_chart():
 
 
 @app.route('/regenerate-day', methods=['POST'])
+@admission.limit('generation')
 def regenerate_day():
     """
     Regenerate a specific day in the diet chart
     
-    Expected payload: User profile data + day_number (1-7)
-    Returns: Single day meal plan
+    Expected payload: User profile data + day_number (1-7), optionally patientId
+    Returns: Single day meal plan (and the new chart version if patientId
+             refers to a saved chart)
     """
     try:
         if diet_generator is None:
@@ -231,14 +359,154 @@ def regenerate_day():
         
         # Regenerate single day
         day_plan = diet_generator.regenerate_single_day(data, int(day_number))
+        result = {
+            'success': True,
+            'dayPlan': day_plan
+        }
+        
+        # Version the saved chart, storing only the blocks of the replaced day
+        patient_id = data.get('patientId')
+        if patient_id and chart_store.has_chart(patient_id):
+            version = chart_store.replace_day(patient_id, day_plan, int(day_number))
+            # Ingest the version the store committed, not a copy read before the write
+            ingest_chart(patient_id, version)
+            result['chartVersion'] = version
+        
+        return jsonify(result)
+        
+    except AdmissionRejected:
+        # Shed by the model router; admission control answers 503 with Retry-After
+        raise
+        
+    except Exception as e:
+        logger.exception("Error regenerating day")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/foods', methods=['GET'])
+@admission.limit('interactive')
+def search_foods():
+    """
+    Search the food catalogue
+    
+    Query params:
+        q: Name prefix for autocomplete
+        category, cuisine, thermalProperty, digestibility, virya, vipaka, rasa,
+        vata, pitta, kapha: Attribute filters (repeat a param to match any of several values)
+        min_<column>, max_<column>: Range filters on calories, protein, carbs, fat, fiber
+        cursor: nextCursor from the previous page
+        limit: Page size (1-100, default 20)
+    Returns: Matching foods, total count and the cursor for the next page
+    """
+    if food_catalogue is None:
+        return jsonify({
+            'success': False,
+            'error': 'Food catalogue not loaded.'
+        }), 500
+    
+    try:
+        filters = {
+            column: request.args.getlist(column)
+            for column in FILTER_COLUMNS if column in request.args
+        }
+        ranges = {}
+        for column in NUMERIC_COLUMNS:
+            low = request.args.get(f'min_{column}', type=float)
+            high = request.args.get(f'max_{column}', type=float)
+            if low is not None or high is not None:
+                ranges[column] = (low, high)
+        cursor = request.args.get('cursor', type=int)
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        
+        started = time.perf_counter()
+        foods, next_cursor, total = food_catalogue.search(
+            prefix=request.args.get('q'),
+            filters=filters,
+            ranges=ranges,
+            cursor=cursor,
+            limit=limit
+        )
+        query_ms = (time.perf_counter() - started) * 1000
         
         return jsonify({
             'success': True,
-            'dayPlan': day_plan
+            'foods': foods,
+            'total': total,
+            'nextCursor': next_cursor,
+            'queryMs': round(query_ms, 3)
         })
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+
+@app.route('/regenerate-meal', methods=['POST'])
+@admission.limit('generation')
+def regenerate_meal():
+    """
+    Regenerate a single meal of one day in the diet chart
+    
+    Expected payload: User profile data + day_number (1-7) + meal
+                      (e.g. 'breakfast'), optionally patientId
+    Returns: Single meal (and the new chart version if patientId refers to
+             a saved chart)
+    """
+    try:
+        if diet_generator is None:
+            return jsonify({
+                'success': False,
+                'error': 'Diet chart generator not initialized.'
+            }), 500
+        
+        data = request.json
+        day_number = data.get('day_number')
+        meal_name = data.get('meal')
+        
+        if not day_number or not (1 <= int(day_number) <= 7):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid day_number. Must be between 1 and 7.'
+            }), 400
+        
+        meal = diet_generator.regenerate_single_meal(data, int(day_number), meal_name)
+        result = {
+            'success': True,
+            'meal': meal
+        }
+        
+        # Version the saved chart with the meal swapped into its day
+        patient_id = data.get('patientId')
+        if patient_id and chart_store.has_chart(patient_id):
+            try:
+                # The store merges the meal under its lock so concurrent swaps don't lose updates
+                version = chart_store.replace_meal(patient_id, int(day_number), meal_name, meal)
+            except ValueError:
+                logger.warning("Day not in saved chart; meal not versioned",
+                               extra={'patientId': patient_id, 'day': int(day_number)})
+            else:
+                ingest_chart(patient_id, version)
+                result['chartVersion'] = version
+        
+        return jsonify(result)
+        
+    except AdmissionRejected:
+        # Shed by the model router; admission control answers 503 with Retry-After
+        raise
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
     except Exception as e:
-        print(f"Error regenerating day: {e}")
+        logger.exception("Error regenerating meal")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -246,6 +514,7 @@ def regenerate_day():
 
 
 @app.route('/save-patient', methods=['POST'])
+@admission.limit('interactive')
 def save_patient():
     """
     Save patient data and diet chart to database
@@ -256,14 +525,11 @@ def save_patient():
     try:
         data = request.json
         
-        # Log received data for debugging
-        print("=" * 80)
-        print("📝 Received patient data for saving:")
-        print(f"   Name: {data.get('name')}")
-        print(f"   Dosha: {data.get('dominantDosha')}")
-        print(f"   Diet Type: {data.get('dietType')}")
-        print(f"   Has Diet Chart: {'dietChart' in data}")
-        print("=" * 80)
+        logger.info("Received patient data for saving", extra={
+            'dosha': data.get('dominantDosha'),
+            'dietType': data.get('dietType'),
+            'hasDietChart': 'dietChart' in data
+        })
         
         # TODO: Implement your database saving logic here
         # Example with SQLAlchemy:
@@ -276,18 +542,25 @@ def save_patient():
         # db.session.add(patient)
         # db.session.commit()
         
-        # Generate temporary patient ID
-        patient_id = f"PT_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        # Patient IDs key the chart store and analytics, so they must never collide
+        patient_id = f"PT_{uuid.uuid4().hex}"
         
-        return jsonify({
+        result = {
             'success': True,
             'message': 'Patient data saved successfully',
             'patientId': patient_id,
             'timestamp': datetime.now().isoformat()
-        })
+        }
+        if data.get('dietChart'):
+            # The cohort is fixed at save time; regenerations keep it
+            version = chart_store.save_chart(patient_id, data['dietChart'], cohort_profile(data))
+            ingest_chart(patient_id, version)
+            result['chartVersion'] = version
+        
+        return jsonify(result)
         
     except Exception as e:
-        print(f"Error saving patient data: {e}")
+        logger.exception("Error saving patient data")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -295,6 +568,7 @@ def save_patient():
 
 
 @app.route('/patients', methods=['GET'])
+@admission.limit('interactive')
 def get_patients():
     """
     Retrieve list of all patients
@@ -313,6 +587,7 @@ def get_patients():
 
 
 @app.route('/patient/<patient_id>', methods=['GET'])
+@admission.limit('interactive')
 def get_patient(patient_id):
     """
     Retrieve specific patient data and diet chart
@@ -320,11 +595,31 @@ def get_patient(patient_id):
     Args:
         patient_id: Unique patient identifier
     
+    Query params:
+        version: Diet chart version to return (defaults to the latest)
+    
     TODO: Implement actual database query
     """
     # TODO: Implement database query
     # patient = Patient.query.filter_by(id=patient_id).first()
     
+    if chart_store.has_chart(patient_id):
+        version = request.args.get('version', type=int)
+        try:
+            diet_chart = chart_store.get_chart(patient_id, version)
+        except KeyError:
+            return jsonify({
+                'success': False,
+                'error': f'Unknown chart version: {version}'
+            }), 404
+        return jsonify({
+            'success': True,
+            'patientId': patient_id,
+            'dietChart': diet_chart,
+            'chartVersion': version or chart_store.version_count(patient_id),
+            'chartVersions': chart_store.version_count(patient_id)
+        })
+    
     return jsonify({
         'success': True,
         'message': 'Database not yet implemented',
@@ -332,6 +627,52 @@ def get_patient(patient_id):
     })
 
 
+@app.route('/analytics/cohorts', methods=['GET'])
+@admission.limit('interactive')
+def cohort_analytics():
+    """
+    Aggregate nutrition statistics across saved charts by patient cohort
+    
+    Query params:
+        group_by: Comma-separated cohort fields (dosha, dietType, weightGoal); default dosha
+        dosha, dietType, weightGoal: Restrict to matching cohorts
+    Returns: Per-group average daily calories, mismatch rates and macro split
+    """
+    try:
+        group_by = [field for field in request.args.get('group_by', 'dosha').split(',') if field]
+        filters = {field: request.args[field] for field in COHORT_FIELDS if field in request.args}
+        return jsonify({
+            'success': True,
+            'groups': nutrition_analytics.cohorts(group_by, filters)
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+
+@app.route('/analytics/chart/<patient_id>', methods=['GET'])
+@admission.limit('interactive')
+def chart_analytics(patient_id):
+    """
+    Server-side calorie totals and mismatch flags for a saved chart
+    
+    Args:
+        patient_id: Unique patient identifier
+    """
+    report = nutrition_analytics.chart_report(patient_id)
+    if report is None:
+        return jsonify({
+            'success': False,
+            'error': 'No saved diet chart for this patient'
+        }), 404
+    return jsonify({
+        'success': True,
+        'report': report
+    })
+
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
@@ -0,0 +1,478 @@
+"""
+chart_store.py -
+Content-Addressed Diet Chart Storage Module
+Splits diet charts into meal blocks and tip lists, stores each unique block
+once under the hash of its content, and keeps every chart version as a compact
+manifest of block references.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+
+
+_DAY_RE = re.compile(r'\d+')
+
+
+def parse_day_number(value, position):
+    """
+    Day number of a weeklyPlan entry
+
+    Models write day numbers as ints, floats or strings ('2', 'Day 2'); a
+    missing or unparseable value falls back to the entry's position.
+
+    Args:
+        value: The entry's 'day' value
+        position (int): Zero-based index of the entry in weeklyPlan
+
+    Returns:
+        int: The day number
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if not math.isnan(value):
+            return int(value)
+    elif isinstance(value, str):
+        match = _DAY_RE.search(value)
+        if match:
+            return int(match.group())
+    return position + 1
+
+
+def canonical_json(value):
+    """Serialize a value deterministically so equal content hashes equally"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def block_hash(encoded):
+    """Return the content address for an encoded block"""
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class BlockStore:
+    """
+    Stores immutable JSON blocks by content hash
+
+    Blocks live in memory, or in a directory on disk when one is given, in
+    which case an LRU of hot encoded blocks sits in front so reassembly
+    rarely touches the disk. Blocks are shared by many charts, so every read
+    decodes a fresh copy that the caller is free to modify.
+    """
+
+    def __init__(self, directory=None, cache_size=4096):
+        """
+        Args:
+            directory (str): Directory to persist blocks in. None keeps them in memory only.
+            cache_size (int): Number of encoded blocks kept in the LRU cache
+        """
+        self.directory = directory
+        self.cache_size = cache_size
+        self._encoded = {}  # only used without a directory
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.block_count = 0
+        self.stored_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._scan_directory()
+
+    def put(self, value):
+        """
+        Store a block if it is not already present
+
+        Args:
+            value: JSON-serializable block content
+
+        Returns:
+            tuple: (hash, True if the block was new)
+        """
+        encoded = canonical_json(value)
+        key = block_hash(encoded)
+        with self._lock:
+            if key in self._encoded or self._exists_on_disk(key):
+                return key, False
+            if self.directory:
+                # Write to a temp file and rename so readers never see a partial block
+                path = self._path(key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(encoded)
+                os.replace(tmp_path, path)
+            else:
+                self._encoded[key] = encoded
+            self.block_count += 1
+            self.stored_bytes += len(encoded.encode('utf-8'))
+        return key, True
+
+    def get(self, key):
+        """
+        Return a freshly decoded copy of the block for a hash
+
+        Raises:
+            KeyError: If no block is stored under the hash
+        """
+        with self._lock:
+            encoded = self._encoded.get(key)
+            if encoded is None and key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                encoded = self._cache[key]
+
+        if encoded is None:
+            if not self.directory or not os.path.exists(self._path(key)):
+                raise KeyError(f"Unknown block: {key}")
+            with open(self._path(key), encoding='utf-8') as f:
+                encoded = f.read()
+            with self._lock:
+                self.cache_misses += 1
+                self._cache[key] = encoded
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return json.loads(encoded)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'blocks': self.block_count,
+                'bytes': self.stored_bytes,
+                'cachedBlocks': len(self._cache),
+                'cacheHits': self.cache_hits,
+                'cacheMisses': self.cache_misses
+            }
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def _scan_directory(self):
+        """Count the blocks already on disk so stats survive a restart"""
+        for shard in os.listdir(self.directory):
+            shard_path = os.path.join(self.directory, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_path):
+                continue
+            for name in os.listdir(shard_path):
+                if name.endswith('.json'):
+                    self.block_count += 1
+                    self.stored_bytes += os.path.getsize(os.path.join(shard_path, name))
+
+    def _exists_on_disk(self, key):
+        return bool(self.directory) and os.path.exists(self._path(key))
+
+
+class ChartStore:
+    """
+    Versioned diet chart storage on top of a BlockStore
+
+    A stored chart version is a manifest: top-level scalars and metadata are
+    kept inline, every meal, day skeleton and tip list is a block reference.
+    Replacing one day only adds the blocks that actually changed. When the
+    block store has a directory, manifests are appended to a log next to the
+    blocks and replayed on startup.
+    """
+
+    MANIFEST_LOG = 'manifests.jsonl'
+
+    def __init__(self, blocks=None):
+        """
+        Args:
+            blocks (BlockStore): Block storage to use. Defaults to an in-memory store.
+        """
+        self.blocks = blocks or BlockStore()
+        self._versions = {}
+        self._attributes = {}
+        self._lock = threading.Lock()
+
+        self.logical_bytes = 0
+        self.manifest_bytes = 0
+
+        self._log_path = None
+        if self.blocks.directory:
+            self._log_path = os.path.join(self.blocks.directory, self.MANIFEST_LOG)
+            self._replay_log()
+
+    def save_chart(self, chart_id, diet_chart, attributes=None):
+        """
+        Store a full diet chart as a new version
+
+        Day numbers are normalized with parse_day_number() on the way in.
+
+        Args:
+            chart_id (str): Identifier of the chart (e.g. the patient id)
+            diet_chart (dict): Diet chart as returned by DietChartGenerator
+            attributes (dict): Small JSON dict kept with the chart (e.g. its
+                analytics cohort). Later day and meal replacements keep it.
+
+        Returns:
+            int: Version number of the stored chart (starting at 1)
+        """
+        manifest = self._split_chart(diet_chart)
+        logical_bytes = len(canonical_json(diet_chart).encode('utf-8'))
+        with self._lock:
+            return self._append_version(chart_id, manifest, logical_bytes, attributes)
+
+    def replace_day(self, chart_id, day_plan, day_number=None):
+        """
+        Store a new version of a chart with one day replaced
+
+        Args:
+            chart_id (str): Identifier of an existing chart
+            day_plan (dict): New plan for the day
+            day_number (int): Day to replace (1-7). Defaults to day_plan['day'].
+
+        Returns:
+            int: New version number
+
+        Raises:
+            KeyError: If the chart does not exist
+            ValueError: If the day is not in the chart
+        """
+        day_number = int(day_number or day_plan.get('day'))
+        day_plan = dict(day_plan, day=day_number)
+        # Read-modify-append under one lock so concurrent replacements all land
+        with self._lock:
+            manifest = dict(self._latest(chart_id))
+            day_refs = list(manifest['weeklyPlan'])
+            index = self._day_index(day_refs, day_number)
+            if index is None:
+                raise ValueError(f"Day {day_number} not found in chart {chart_id}")
+
+            day_refs[index] = self._store_day(day_plan)
+            manifest['weeklyPlan'] = day_refs
+            logical_bytes = len(canonical_json(self._assemble(manifest)).encode('utf-8'))
+            return self._append_version(chart_id, manifest, logical_bytes)
+
+    def replace_meal(self, chart_id, day_number, meal_name, meal):
+        """
+        Store a new version of a chart with one meal of one day replaced
+
+        The day's totalCalories is recomputed from its meals. The merge happens
+        under the store lock so concurrent meal swaps on the same day all land.
+
+        Args:
+            chart_id (str): Identifier of an existing chart
+            day_number (int): Day holding the meal (1-7)
+            meal_name (str): Meal slot (e.g. 'lunch')
+            meal (dict): New meal
+
+        Returns:
+            int: New version number
+
+        Raises:
+            KeyError: If the chart does not exist
+            ValueError: If the day is not in the chart
+        """
+        day_number = int(day_number)
+        with self._lock:
+            manifest = dict(self._latest(chart_id))
+            day_refs = list(manifest['weeklyPlan'])
+            index = self._day_index(day_refs, day_number)
+            if index is None:
+                raise ValueError(f"Day {day_number} not found in chart {chart_id}")
+
+            day_plan = self._assemble_day(day_refs[index])
+            meals = day_plan.get('meals') if isinstance(day_plan.get('meals'), dict) else {}
+            day_plan['meals'] = dict(meals, **{meal_name: meal})
+            day_plan['totalCalories'] = sum(
+                m.get('calories') for m in day_plan['meals'].values()
+                if isinstance(m, dict) and isinstance(m.get('calories'), (int, float))
+            )
+            day_refs[index] = self._store_day(day_plan)
+            manifest['weeklyPlan'] = day_refs
+            logical_bytes = len(canonical_json(self._assemble(manifest)).encode('utf-8'))
+            return self._append_version(chart_id, manifest, logical_bytes)
+
+    def get_chart(self, chart_id, version=None):
+        """
+        Reassemble a stored chart
+
+        Args:
+            chart_id (str): Identifier of the chart
+            version (int): Version to load. Defaults to the latest.
+
+        Returns:
+            dict: The full diet chart
+
+        Raises:
+            KeyError: If the chart or version does not exist
+        """
+        with self._lock:
+            versions = self._versions[chart_id]
+            if version is None:
+                manifest = versions[-1]
+            elif 1 <= version <= len(versions):
+                manifest = versions[version - 1]
+            else:
+                raise KeyError(f"Unknown version {version} of chart {chart_id}")
+        return self._assemble(manifest)
+
+    def chart_ids(self):
+        with self._lock:
+            return list(self._versions)
+
+    def attributes(self, chart_id):
+        """Return the attributes recorded when the chart was last saved"""
+        with self._lock:
+            return dict(self._attributes.get(chart_id) or {})
+
+    def has_chart(self, chart_id):
+        with self._lock:
+            return chart_id in self._versions
+
+    def version_count(self, chart_id):
+        with self._lock:
+            return len(self._versions.get(chart_id, []))
+
+    def stats(self):
+        """Return storage counters, including the dedup compression ratio"""
+        block_stats = self.blocks.stats()
+        with self._lock:
+            physical = block_stats['bytes'] + self.manifest_bytes
+            return {
+                'charts': len(self._versions),
+                'versions': sum(len(v) for v in self._versions.values()),
+                'logicalBytes': self.logical_bytes,
+                'physicalBytes': physical,
+                'compressionRatio': round(self.logical_bytes / physical, 2) if physical else None,
+                'blocks': block_stats
+            }
+
+    def _split_chart(self, diet_chart):
+        manifest = {}
+        for key, value in diet_chart.items():
+            if key == 'weeklyPlan':
+                manifest[key] = [
+                    self._store_day(dict(day, day=parse_day_number(day.get('day'), position))
+                                    if isinstance(day, dict) else day)
+                    for position, day in enumerate(value)
+                ]
+            elif isinstance(value, list):
+                manifest[key] = {'$ref': self.blocks.put(value)[0]}
+            else:
+                manifest[key] = value
+        return manifest
+
+    def _store_day(self, day_plan):
+        """Store a day's meals as blocks and return the day skeleton's hash"""
+        if not isinstance(day_plan, dict):
+            return self.blocks.put(day_plan)[0]
+        skeleton = dict(day_plan)
+        meals = day_plan.get('meals')
+        if isinstance(meals, dict):
+            skeleton['meals'] = {name: self.blocks.put(meal)[0] for name, meal in meals.items()}
+        return self.blocks.put(skeleton)[0]
+
+    def _assemble(self, manifest):
+        chart = {}
+        for key, value in manifest.items():
+            if key == 'weeklyPlan':
+                chart[key] = [self._assemble_day(ref) for ref in value]
+            elif isinstance(value, dict) and set(value) == {'$ref'}:
+                chart[key] = self.blocks.get(value['$ref'])
+            else:
+                chart[key] = value
+        return chart
+
+    def _assemble_day(self, ref):
+        day = self.blocks.get(ref)
+        if isinstance(day, dict) and isinstance(day.get('meals'), dict):
+            day['meals'] = {name: self.blocks.get(meal_ref) for name, meal_ref in day['meals'].items()}
+        return day
+
+    def _append_version(self, chart_id, manifest, logical_bytes, attributes=None):
+        """Record a new version; the caller holds self._lock"""
+        if self._log_path:
+            entry = {'chartId': chart_id, 'manifest': manifest, 'logicalBytes': logical_bytes}
+            if attributes is not None:
+                entry['attributes'] = attributes
+            entry = canonical_json(entry)
+            with open(self._log_path, 'a', encoding='utf-8') as f:
+                f.write(entry + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        return self._add_version(chart_id, manifest, logical_bytes, attributes)
+
+    def _add_version(self, chart_id, manifest, logical_bytes, attributes=None):
+        if attributes is not None:
+            self._attributes[chart_id] = attributes
+        versions = self._versions.setdefault(chart_id, [])
+        versions.append(manifest)
+        self.logical_bytes += logical_bytes
+        self.manifest_bytes += len(canonical_json(manifest).encode('utf-8'))
+        return len(versions)
+
+    def _replay_log(self):
+        """Rebuild the version history from the manifest log"""
+        if not os.path.exists(self._log_path):
+            return
+        with open(self._log_path, 'rb+') as f:
+            data = f.read()
+            complete = data[:data.rfind(b'\n') + 1]
+            if len(complete) != len(data):
+                # Drop a torn final line from a crash mid-write so later appends stay parseable
+                f.truncate(len(complete))
+        for line in complete.decode('utf-8').splitlines():
+            entry = json.loads(line)
+            self._add_version(entry['chartId'], entry['manifest'], entry['logicalBytes'],
+                              entry.get('attributes'))
+
+    def _latest(self, chart_id):
+        versions = self._versions.get(chart_id)
+        if not versions:
+            raise KeyError(f"Unknown chart: {chart_id}")
+        return versions[-1]
+
+    def _day_index(self, day_refs, day_number):
+        for index, ref in enumerate(day_refs):
+            day = self.blocks.get(ref)
+            if isinstance(day, dict) and parse_day_number(day.get('day'), index) == day_number:
+                return index
+        return None
+
+
+if __name__ == '__main__':
+    # Compression benchmark on a synthetic corpus built from realistic meal variants
+    import random
+    import time
+    from diet_chart_generator import build_stub_chart
+
+    rng = random.Random(42)
+    base = build_stub_chart()
+    meal_variants = {}
+    for day in base['weeklyPlan']:
+        for name, meal in day['meals'].items():
+            variants = meal_variants.setdefault(name, [])
+            for n in range(12):
+                variants.append(dict(meal, calories=meal['calories'] + 25 * (n % 4),
+                                     description=f"{meal['description']} option {n}"))
+    tip_lists = [base['doshaBalancingTips'] + [f"Tip variant {n}"] for n in range(20)]
+
+    store = ChartStore()
+    started = time.perf_counter()
+    for patient in range(2000):
+        chart = {key: value for key, value in base.items()}
+        chart['weeklyPlan'] = []
+        for day in base['weeklyPlan']:
+            meals = {name: rng.choice(meal_variants[name]) for name in day['meals']}
+            chart['weeklyPlan'].append(dict(day, meals=meals,
+                                            totalCalories=sum(m['calories'] for m in meals.values())))
+        chart['doshaBalancingTips'] = rng.choice(tip_lists)
+        chart['metadata'] = {'userName': f"Patient {patient}", 'dosha': rng.choice(['Vata', 'Pitta', 'Kapha'])}
+        store.save_chart(f"PT_{patient}", chart)
+        if patient % 5 == 0:
+            new_day = dict(chart['weeklyPlan'][2],
+                           meals=dict(chart['weeklyPlan'][2]['meals'], dinner=rng.choice(meal_variants['dinner'])))
+            store.replace_day(f"PT_{patient}", new_day, 3)
+    elapsed = time.perf_counter() - started
+
+    stats = store.stats()
+    print(json.dumps(stats, indent=2))
+    print(f"Stored {stats['versions']} chart versions in {elapsed:.2f}s "
+          f"- compression ratio {stats['compressionRatio']}x")
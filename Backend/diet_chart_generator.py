@@ -6,29 +6,64 @@ Uses Google Gemini API to generate personalized 7-day meal plans
 
 import google.generativeai as genai
 import json
+import logging
+import math
 import os
 import re
+import threading
+import time
 from datetime import datetime
 
+import prompt_templates
+from admission_control import AdmissionRejected
+from model_router import SHED, build_default_router
+
+
+logger = logging.getLogger('ayurpulse.diet_chart_generator')
+
 
 class DietChartGenerator:
     """
     Generates personalized Ayurvedic diet charts using AI
     """
     
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, model=None, model_factory=None, router=None,
+                 food_catalogue=None, context_cache=None):
         """
         Initialize the diet chart generator with Gemini API
         
         Args:
             api_key (str): Google Gemini API key. If None, reads from environment.
+            model: Object with a Gemini-style generate_content() method. When
+                   given, it is used for every model tier instead of the Gemini
+                   API (e.g. StubGenerativeModel).
+            model_factory (callable): Returns a model for a model name; overrides
+                                      `model` (e.g. stub_model_factory()).
+            router (ModelRouter): Routing policy. Defaults to build_default_router().
+            food_catalogue (FoodCatalogue): Catalogue used to suggest foods in the
+                                            prompt and check items against the avoid list.
+            context_cache: Object whose model_for(model_name, get_model) returns a
+                           model bound to the cached static prompt prefix (e.g.
+                           StubContextCache). None sends the full prompt on every call.
         """
+        self.food_catalogue = food_catalogue
+        self.context_cache = context_cache
+        self.router = router or build_default_router()
+        self._models = {}
+        self._prompt_stats = {}
+        self._stats_lock = threading.Lock()
+        
+        if model_factory is not None or model is not None:
+            self.api_key = None
+            self.model_factory = model_factory or (lambda model_name: model)
+            return
+        
         self.api_key = api_key or os.environ.get('GEMINI_API_KEY')
         if not self.api_key or self.api_key == 'YOUR_API_KEY_HERE':
             raise ValueError("Gemini API key not configured. Set GEMINI_API_KEY environment variable.")
         
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model_factory = genai.GenerativeModel
     
     def generate_diet_chart(self, user_data):
         """
@@ -50,7 +85,7 @@ class DietChartGenerator:
         profile = self._extract_user_profile(user_data)
         
         # Build the prompt
-        prompt = self._build_prompt(profile)
+        prompt = self._build_prompt(profile, 'full_week')
         
         # Call Gemini API
         response = self._call_gemini_api(prompt)
@@ -65,6 +100,8 @@ class DietChartGenerator:
             'dosha': profile['dosha'],
             'dietType': profile['diet_type']
         }
+        if self.food_catalogue is not None:
+            diet_chart['metadata']['avoidListViolations'] = self._avoid_list_violations(diet_chart, profile)
         
         return diet_chart
     
@@ -101,174 +138,168 @@ class DietChartGenerator:
             'timeframe': data.get('timeframe', '')
         }
     
-    def _build_prompt(self, profile):
-        """Build the detailed prompt for Gemini API"""
-        
-        # Format lists for display
-        health_conditions_str = ', '.join(profile['health_conditions']) if profile['health_conditions'] else 'None'
-        allergies_str = ', '.join(profile['allergies']) if profile['allergies'] else 'None'
-        food_preferences_str = ', '.join(profile['food_preferences']) if profile['food_preferences'] else 'Flexible'
-        disliked_foods_str = ', '.join(profile['disliked_foods']) if profile['disliked_foods'] else 'None'
-        health_goals_str = ', '.join(profile['health_goals']) if profile['health_goals'] else 'General wellness'
-        
-        # Combine allergies and dislikes for strict avoidance
+    def _build_prompt(self, profile, request_type='full_week', day_number=None, meal_name=None):
+        """Render the prompt for a request type from the shared template family"""
         avoid_list = profile['allergies'] + profile['disliked_foods']
-        avoid_str = ', '.join(avoid_list) if avoid_list else 'None'
-        
-        prompt = f"""
-You are an expert Ayurvedic nutritionist. Create a 7-day diet chart as PURE JSON with NO markdown formatting.
-
-USER PROFILE:
-- Name: {profile['name']}
-- Dosha: {profile['dosha']}
-- Diet Type: {profile['diet_type']}
-- MUST AVOID: {avoid_str}
-- Health Goals: {health_goals_str}
-- Age: {profile['age']}, Weight: {profile['weight']}kg, Activity: {profile['activity_level']}
-
-CRITICAL JSON RULES:
-1. Items array: Use ONLY simple food names - NO parentheses, NO measurements
-2. Measurements go in description field
-3. NO special characters or quotes inside strings
-4. Keep strings SHORT and SIMPLE
-
-EXAMPLE (follow this EXACT format):
-
-{{
-  "weeklyPlan": [
-    {{
-      "day": 1,
-      "dayName": "Monday",
-      "meals": {{
-        "earlyMorning": {{
-          "time": "6:00 AM",
-          "items": ["Warm lemon water"],
-          "description": "Start your day with 1 glass warm water mixed with half lemon",
-          "calories": 10,
-          "ayurvedicBenefit": "Activates digestive fire and detoxifies body"
-        }},
-        "breakfast": {{
-          "time": "8:00 AM",
-          "items": ["Oats porridge", "Dates", "Herbal tea"],
-          "description": "1 bowl oats cooked with 3-4 chopped dates and cup of ginger tea",
-          "calories": 400,
-          "ayurvedicBenefit": "Balances {profile['dosha']} dosha and provides sustained energy"
-        }},
-        "midMorning": {{
-          "time": "11:00 AM",
-          "items": ["Apple", "Almonds"],
-          "description": "1 medium apple with 5-6 soaked almonds",
-          "calories": 150,
-          "ayurvedicBenefit": "Natural energy boost and healthy fats"
-        }},
-        "lunch": {{
-          "time": "1:00 PM",
-          "items": ["Dal", "Rice", "Vegetable curry", "Salad", "Buttermilk"],
-          "description": "1 bowl moong dal, 1 cup rice, mixed vegetable curry, cucumber salad, 1 glass buttermilk",
-          "calories": 600,
-          "ayurvedicBenefit": "Main meal during peak digestive fire"
-        }},
-        "eveningSnack": {{
-          "time": "5:00 PM",
-          "items": ["Herbal tea", "Roasted chickpeas"],
-          "description": "1 cup ginger-cardamom tea with handful of roasted chana",
-          "calories": 200,
-          "ayurvedicBenefit": "Light protein to prevent overeating at dinner"
-        }},
-        "dinner": {{
-          "time": "7:30 PM",
-          "items": ["Khichdi", "Cucumber raita"],
-          "description": "1 bowl moong dal khichdi with cooling cucumber yogurt",
-          "calories": 450,
-          "ayurvedicBenefit": "Easy to digest for restful sleep"
-        }},
-        "beforeBed": {{
-          "time": "9:30 PM",
-          "items": ["Turmeric milk"],
-          "description": "1 glass warm milk with half teaspoon turmeric and honey",
-          "calories": 100,
-          "ayurvedicBenefit": "Promotes deep sleep and reduces inflammation"
-        }}
-      }},
-      "totalCalories": 1910,
-      "waterIntake": "8-10 glasses throughout the day",
-      "specialNotes": "Start your day with light yoga or pranayama breathing"
-    }}
-  ],
-  "doshaBalancingTips": [
-    "Eat warm and cooked foods to balance {profile['dosha']} dosha",
-    "Maintain regular meal times to strengthen digestive fire",
-    "Avoid ice-cold drinks especially with meals",
-    "Include warming spices like ginger and cumin in cooking"
-  ],
-  "lifestyleRecommendations": [
-    "Wake up before sunrise ideally around 6 AM",
-    "Practice 10-15 minutes of pranayama breathing daily",
-    "Take a 15-minute walk after lunch for digestion",
-    "Go to sleep by 10 PM for optimal rest"
-  ],
-  "ayurvedicSupplements": [
-    {{
-      "name": "Triphala",
-      "benefit": "Supports healthy digestion and gentle detoxification",
-      "timing": "Take before bed with warm water"
-    }}
-  ],
-  "importantReminders": [
-    "Eat mindfully without phone or TV distractions",
-    "Chew each bite thoroughly at least 20 times",
-    "Drink water between meals not during meals",
-    "Listen to your body hunger and fullness signals"
-  ]
-}}
-
-STRICT REQUIREMENTS:
-1. ALL meals MUST be {profile['diet_type']} - NO exceptions
-2. NEVER include: {avoid_str}
-3. Generate 7 DIFFERENT days - vary the meals each day
-4. Put ALL measurements in description NOT in items
-5. Keep item names SIMPLE without numbers or parentheses
-6. Adjust calories based on goal: {profile['weight_goal']}
-7. Use {profile['dosha']}-balancing ingredients and spices
-8. Return ONLY the JSON object - absolutely NO markdown, NO backticks, NO ```json
-
-Generate the complete 7-day plan now:
-"""
-        return prompt
+        return prompt_templates.render(
+            request_type,
+            profile,
+            recommended_foods=self._recommended_foods(profile, avoid_list),
+            day_number=day_number,
+            meal_name=meal_name
+        )
+    
+    def _recommended_foods(self, profile, avoid_list):
+        """Catalogue foods that pacify the user's dosha, respecting diet type and avoid list"""
+        if self.food_catalogue is None:
+            return []
+        exclude_categories = ['Dairy'] if str(profile['diet_type']).lower() == 'vegan' else []
+        return self.food_catalogue.pacifying_foods(
+            profile['dosha'], exclude=avoid_list, exclude_categories=exclude_categories
+        )
+    
+    def _avoid_list_violations(self, diet_chart, profile):
+        """Meal items that contain one of the user's allergies or disliked foods"""
+        avoid_list = profile['allergies'] + profile['disliked_foods']
+        items = {
+            item
+            for day in diet_chart.get('weeklyPlan', []) if isinstance(day, dict)
+            for meal in (day.get('meals') or {}).values() if isinstance(meal, dict)
+            for item in (meal.get('items') or []) if isinstance(item, str)
+        }
+        violations = sorted(self.food_catalogue.avoided_items(items, avoid_list))
+        if violations:
+            logger.warning("Diet chart contains items from the avoid list",
+                           extra={'items': violations, 'avoid': avoid_list})
+        return violations
+    
+    def _get_model(self, model_name):
+        """Return the (cached) model object for a routed model name"""
+        if model_name not in self._models:
+            self._models[model_name] = self.model_factory(model_name)
+        return self._models[model_name]
     
     def _call_gemini_api(self, prompt):
         """
         Call Gemini API with the constructed prompt
         
+        The model tier and generation settings are chosen by the router for
+        the request type, and the call's latency and size are fed back to it.
+        When a context cache holds the static prefix for the routed model,
+        only the dynamic part of the prompt is sent. A response cut off by an
+        adaptive output-token cap is retried once at the tier's full cap.
+        
         Args:
-            prompt (str): The complete prompt for the API
+            prompt (PromptParts): Prompt rendered by _build_prompt()
         
         Returns:
             str: Raw response text from the API
+        
+        Raises:
+            AdmissionRejected: If the router sheds the request because every
+                               model tier is over its latency budget
         """
+        decision = self.router.route(prompt.request_type)
+        if decision.model_name == SHED:
+            budget = self.router.policies[prompt.request_type].latency_budget
+            raise AdmissionRejected(prompt.request_type, 'every model tier is over its latency budget',
+                                    retry_after=max(1, math.ceil(budget)))
+        model = None
+        if self.context_cache is not None:
+            model = self.context_cache.model_for(decision.model_name, self._get_model)
+        prompt_text = prompt.dynamic if model is not None else prompt.text
+        model = model or self._get_model(decision.model_name)
+        
+        response, text, truncated = self._generate(model, prompt_text, decision, decision.generation_config)
+        if truncated and decision.generation_config['max_output_tokens'] < decision.tier_output_tokens:
+            logger.info("Response hit the adaptive output-token cap; retrying at the tier cap",
+                        extra={'requestType': prompt.request_type, 'model': decision.model_name,
+                               'cap': decision.generation_config['max_output_tokens']})
+            generation_config = dict(decision.generation_config, max_output_tokens=decision.tier_output_tokens)
+            response, text, _ = self._generate(model, prompt_text, decision, generation_config)
+        
+        self._record_prompt(prompt, prompt_text, getattr(response, 'usage_metadata', None))
+        return text
+    
+    def _generate(self, model, prompt_text, decision, generation_config):
+        """Make one model call and feed its latency and output size to the router"""
+        started = time.perf_counter()
         try:
-            # Configure generation settings - using only supported parameters
-            generation_config = {
-                'temperature': 0.7,
-                'top_p': 0.95,
-                'top_k': 40,
-                'max_output_tokens': 8192,
-            }
-            
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config
-            )
-            return response.text
+            response = model.generate_content(prompt_text, generation_config=generation_config)
+            truncated = self._hit_token_limit(response)
+            try:
+                text = response.text
+            except ValueError:
+                # A response cut off before any text was produced has no parts
+                if not truncated:
+                    raise
+                text = ''
         except Exception as e:
+            self.router.record(decision, time.perf_counter() - started, ok=False)
             raise Exception(f"Gemini API call failed: {str(e)}")
+        
+        # Thinking tokens are spent out of max_output_tokens too, so the cap
+        # has to be sized on both
+        usage = getattr(response, 'usage_metadata', None)
+        output_tokens = ((getattr(usage, 'candidates_token_count', None) or len(text) // 4)
+                         + (getattr(usage, 'thoughts_token_count', None) or 0))
+        self.router.record(decision, time.perf_counter() - started,
+                           output_tokens=output_tokens, truncated=truncated)
+        return response, text, truncated
     
-    def _parse_response(self, response_text):
+    def _record_prompt(self, prompt, prompt_text, usage):
+        """Accumulate assembly time and input-token counts per request type"""
+        input_tokens = getattr(usage, 'prompt_token_count', None) or prompt_templates.estimate_tokens(prompt_text)
+        cached_tokens = getattr(usage, 'cached_content_token_count', None) or 0
+        with self._stats_lock:
+            stats = self._prompt_stats.setdefault(prompt.request_type, {
+                'calls': 0, 'assemblySeconds': 0.0, 'inputTokens': 0, 'cachedTokens': 0
+            })
+            stats['calls'] += 1
+            stats['assemblySeconds'] += prompt.assembly_seconds
+            stats['inputTokens'] += input_tokens
+            stats['cachedTokens'] += cached_tokens
+    
+    def prompt_stats(self):
+        """
+        Per request type prompt metrics
+        
+        Returns:
+            dict: Average assembly time (microseconds) and input / cached /
+                  billed-at-full-rate tokens per call
+        """
+        with self._stats_lock:
+            result = {}
+            for request_type, stats in self._prompt_stats.items():
+                calls = stats['calls']
+                result[request_type] = {
+                    'calls': calls,
+                    'avgAssemblyMicros': round(stats['assemblySeconds'] / calls * 1e6, 1),
+                    'avgInputTokens': round(stats['inputTokens'] / calls, 1),
+                    'avgCachedTokens': round(stats['cachedTokens'] / calls, 1),
+                    'avgUncachedTokens': round((stats['inputTokens'] - stats['cachedTokens']) / calls, 1)
+                }
+            result['staticPrefixTokens'] = prompt_templates.estimate_tokens(prompt_templates.STATIC_PREFIX)
+            result['contextCache'] = type(self.context_cache).__name__ if self.context_cache else None
+            return result
+    
+    @staticmethod
+    def _hit_token_limit(response):
+        """True if Gemini stopped generating because of max_output_tokens"""
+        candidates = getattr(response, 'candidates', None)
+        if not candidates:
+            return False
+        finish_reason = getattr(candidates[0], 'finish_reason', None)
+        return getattr(finish_reason, 'name', finish_reason) in ('MAX_TOKENS', 2)
+    
+    def _parse_response(self, response_text, validator=None):
         """
         Parse and clean the API response
         
         Args:
             response_text (str): Raw response from Gemini
+            validator (callable): Structure check for the parsed JSON.
+                                  Defaults to _validate_diet_chart.
         
         Returns:
             dict: Parsed JSON diet chart
@@ -297,30 +328,31 @@ Generate the complete 7-day plan now:
         # This preserves the text but removes problematic formatting
         cleaned_text = re.sub(r'\(([^)]*)\)', r'\1', cleaned_text)
         
+        validator = validator or self._validate_diet_chart
         try:
             diet_chart = json.loads(cleaned_text)
             
             # Validate structure
-            self._validate_diet_chart(diet_chart)
+            validator(diet_chart)
             
             return diet_chart
             
         except json.JSONDecodeError as e:
-            print(f"JSON Parse Error: {e}")
-            print(f"Error at position {e.pos}")
+            logger.warning("JSON parse error in model response",
+                           extra={'error': e.msg, 'pos': e.pos, 'responseLength': len(cleaned_text)})
             
-            # Show context around error
-            if e.pos > 100:
-                print(f"Context: ...{cleaned_text[e.pos-100:e.pos+100]}...")
-            else:
-                print(f"Start: {cleaned_text[:min(500, len(cleaned_text))]}")
+            # Show context around error (only built when debug logging is on)
+            if logger.isEnabledFor(logging.DEBUG):
+                start = max(e.pos - 100, 0)
+                logger.debug("Context around JSON parse error",
+                             extra={'context': cleaned_text[start:e.pos + 100]})
             
             # Try additional cleaning
             try:
                 # Remove control characters
                 cleaned_text = re.sub(r'[\x00-\x1F\x7F]', '', cleaned_text)
                 diet_chart = json.loads(cleaned_text)
-                self._validate_diet_chart(diet_chart)
+                validator(diet_chart)
                 return diet_chart
             except:
                 # Re-raise original error
@@ -347,15 +379,34 @@ Generate the complete 7-day plan now:
             raise ValueError("weeklyPlan must be a list")
         
         if len(diet_chart['weeklyPlan']) != 7:
-            print(f"Warning: Expected 7 days, got {len(diet_chart['weeklyPlan'])}")
+            logger.warning("Unexpected number of days in diet chart",
+                           extra={'expected': 7, 'got': len(diet_chart['weeklyPlan'])})
         
         # Validate first day structure as sample
         if diet_chart['weeklyPlan']:
-            first_day = diet_chart['weeklyPlan'][0]
-            required_day_keys = ['day', 'dayName', 'meals', 'totalCalories']
-            for key in required_day_keys:
-                if key not in first_day:
-                    raise ValueError(f"Missing required key in day structure: {key}")
+            self._validate_day(diet_chart['weeklyPlan'][0])
+    
+    def _validate_single_day(self, response):
+        """
+        Validate a single-day response: a weeklyPlan with exactly one day
+        
+        Raises:
+            ValueError: If the day is missing, repeated or malformed
+        """
+        weekly_plan = response.get('weeklyPlan') if isinstance(response, dict) else None
+        if not isinstance(weekly_plan, list) or len(weekly_plan) != 1:
+            count = len(weekly_plan) if isinstance(weekly_plan, list) else 0
+            raise ValueError(f"Expected exactly one day in weeklyPlan, got {count}")
+        self._validate_day(weekly_plan[0])
+    
+    def _validate_day(self, day):
+        """Check the keys every day of a weeklyPlan must have"""
+        if not isinstance(day, dict):
+            raise ValueError("Each day in weeklyPlan must be an object")
+        required_day_keys = ['day', 'dayName', 'meals', 'totalCalories']
+        for key in required_day_keys:
+            if key not in day:
+                raise ValueError(f"Missing required key in day structure: {key}")
     
     def regenerate_single_day(self, user_data, day_number):
         """
@@ -367,24 +418,202 @@ Generate the complete 7-day plan now:
         
         Returns:
             dict: Single day meal plan
+        
+        Raises:
+            ValueError: If the response is not exactly one valid day
         """
         profile = self._extract_user_profile(user_data)
-        
-        # Build a simplified prompt for single day
-        prompt = f"""
-Generate a single day indian meal plan for a {profile['dosha']} dosha individual.
-Day number: {day_number}
-Diet type: {profile['diet_type']}
-Avoid: {', '.join(profile['allergies'] + profile['disliked_foods'])}
-Goals: {', '.join(profile['health_goals'])}
-
-Return JSON for just one day with the same meal structure.
-"""
+        prompt = self._build_prompt(profile, 'single_day', day_number=day_number)
         
         response = self._call_gemini_api(prompt)
-        day_plan = self._parse_response(response)
+        day_plan = self._parse_response(response, validator=self._validate_single_day)['weeklyPlan'][0]
+        day_plan['day'] = day_number
+        day_plan['dayName'] = prompt_templates.DAY_NAMES[(day_number - 1) % 7]
         
         return day_plan
+    
+    def regenerate_single_meal(self, user_data, day_number, meal_name):
+        """
+        Regenerate one meal of one day
+        
+        Args:
+            user_data (dict): User profile data
+            day_number (int): Day number of the meal (1-7)
+            meal_name (str): Meal slot, e.g. 'breakfast' or 'dinner'
+        
+        Returns:
+            dict: Single meal with time, items, description, calories and ayurvedicBenefit
+        
+        Raises:
+            ValueError: For unknown meal slots or an invalid meal in the response
+        """
+        profile = self._extract_user_profile(user_data)
+        prompt = self._build_prompt(profile, 'single_meal', day_number=day_number, meal_name=meal_name)
+        
+        response = self._call_gemini_api(prompt)
+        meal = self._parse_response(response, validator=self._validate_meal)
+        
+        return meal['meal']
+    
+    def _validate_meal(self, response):
+        """
+        Validate the structure of a single-meal response
+        
+        Raises:
+            ValueError: If required fields are missing
+        """
+        meal = response.get('meal')
+        if not isinstance(meal, dict):
+            raise ValueError("Missing required key in meal response: meal")
+        for key in ['time', 'items', 'calories']:
+            if key not in meal:
+                raise ValueError(f"Missing required key in meal structure: {key}")
+
+
+class StubContextCache:
+    """
+    Offline stand-in for a provider-side context cache, for use with stub models
+    
+    Prepends the static prefix on the "server side" and reports its tokens
+    as cached, so prompt metrics show what prefix caching would save.
+    Entries are created under the lock, so each model gets exactly one.
+    """
+    
+    def __init__(self, static_prefix=prompt_templates.STATIC_PREFIX):
+        self.static_prefix = static_prefix
+        self.creates = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def model_for(self, model_name, get_model):
+        with self._lock:
+            if model_name not in self._entries:
+                self.creates += 1
+                self._entries[model_name] = StubCachedModel(get_model(model_name), self.static_prefix)
+            return self._entries[model_name]
+
+
+class StubCachedModel:
+    """A stub model bound to a cached prompt prefix"""
+    
+    def __init__(self, model, static_prefix):
+        self.model = model
+        self.static_prefix = static_prefix
+    
+    def generate_content(self, prompt, generation_config=None):
+        response = self.model.generate_content(self.static_prefix + prompt, generation_config=generation_config)
+        response.usage_metadata.cached_content_token_count = prompt_templates.estimate_tokens(self.static_prefix)
+        return response
+
+
+class StubUsage:
+    """Minimal stand-in for Gemini usage metadata"""
+    
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = 0
+
+
+class StubResponse:
+    """Minimal stand-in for a Gemini response object"""
+    
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class StubGenerativeModel:
+    """
+    Offline stand-in for genai.GenerativeModel
+    
+    Returns a fixed, valid chart (or the single day or meal the prompt asks
+    for) after a configurable delay so the backend can be exercised (e.g.
+    under synthetic overload) without an API key.
+    """
+    
+    def __init__(self, latency=0.0, model_name='stub'):
+        """
+        Args:
+            latency (float): Seconds to sleep before each response
+            model_name (str): Name of the model this stub stands in for
+        """
+        self.latency = latency
+        self.model_name = model_name
+        self.calls = 0
+    
+    def generate_content(self, prompt, generation_config=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        
+        chart = build_stub_chart()
+        match = prompt_templates.REQUEST_TYPE_RE.search(prompt)
+        request_type = match.group(1) if match else 'full_week'
+        if request_type == 'single_day':
+            chart = {'weeklyPlan': chart['weeklyPlan'][:1]}
+        elif request_type == 'single_meal':
+            chart = {'meal': chart['weeklyPlan'][0]['meals']['lunch']}
+        
+        text = json.dumps(chart)
+        usage = StubUsage(prompt_templates.estimate_tokens(prompt), prompt_templates.estimate_tokens(text))
+        return StubResponse(text, usage)
+
+
+def stub_model_factory(latencies, default_latency=0.0):
+    """
+    Build a model_factory returning stubs with per-model simulated latency
+    
+    Args:
+        latencies (dict): Seconds of latency per model name
+        default_latency (float): Latency for models not in `latencies`
+    
+    Returns:
+        callable: Factory suitable for DietChartGenerator(model_factory=...)
+    """
+    def factory(model_name):
+        return StubGenerativeModel(latencies.get(model_name, default_latency), model_name)
+    return factory
+
+
+def build_stub_chart():
+    """Build the canned diet chart returned by StubGenerativeModel"""
+    day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    meals = {
+        'earlyMorning': ('6:00 AM', ['Warm lemon water'], 10),
+        'breakfast': ('8:00 AM', ['Oats porridge', 'Dates', 'Herbal tea'], 400),
+        'midMorning': ('11:00 AM', ['Apple', 'Almonds'], 150),
+        'lunch': ('1:00 PM', ['Dal', 'Rice', 'Vegetable curry', 'Salad', 'Buttermilk'], 600),
+        'eveningSnack': ('5:00 PM', ['Herbal tea', 'Roasted chickpeas'], 200),
+        'dinner': ('7:30 PM', ['Khichdi', 'Cucumber raita'], 450),
+        'beforeBed': ('9:30 PM', ['Turmeric milk'], 100)
+    }
+    weekly_plan = []
+    for index, day_name in enumerate(day_names):
+        weekly_plan.append({
+            'day': index + 1,
+            'dayName': day_name,
+            'meals': {
+                meal: {
+                    'time': meal_time,
+                    'items': items,
+                    'description': ', '.join(items),
+                    'calories': calories,
+                    'ayurvedicBenefit': 'Supports balanced digestion'
+                }
+                for meal, (meal_time, items, calories) in meals.items()
+            },
+            'totalCalories': sum(calories for _, _, calories in meals.values()),
+            'waterIntake': '8-10 glasses throughout the day',
+            'specialNotes': 'Start your day with light yoga or pranayama breathing'
+        })
+    return {
+        'weeklyPlan': weekly_plan,
+        'doshaBalancingTips': ['Eat warm and cooked foods', 'Maintain regular meal times'],
+        'lifestyleRecommendations': ['Go to sleep by 10 PM for optimal rest'],
+        'ayurvedicSupplements': [],
+        'importantReminders': ['Eat mindfully without phone or TV distractions']
+    }
 
 
 def generate_diet_chart(user_data, api_key=None):
@@ -0,0 +1,382 @@
+"""
+food_catalogue.py -
+Indexed Food Catalogue Module
+Holds the food catalogue in compact columnar arrays with a prefix index for
+name autocomplete, bitmap indexes on Ayurvedic attributes and vectorized
+range filters on calories and macros.
+"""
+
+import bisect
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+
+DEFAULT_CATALOGUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'food_catalogue.json')
+
+# Numeric columns that support range filters
+NUMERIC_COLUMNS = ('calories', 'protein', 'carbs', 'fat', 'fiber')
+
+# Single-valued attributes stored dictionary-encoded with a bitmap per value
+CATEGORICAL_COLUMNS = ('category', 'cuisine', 'thermalProperty', 'digestibility', 'virya', 'vipaka')
+
+# Per-dosha effect columns, taken from the item's doshaEffect mapping
+DOSHA_COLUMNS = ('vata', 'pitta', 'kapha')
+
+# Multi-valued attributes: an item is in the bitmap of every value it lists
+MULTI_VALUE_COLUMNS = ('rasa',)
+
+FILTER_COLUMNS = CATEGORICAL_COLUMNS + DOSHA_COLUMNS + MULTI_VALUE_COLUMNS
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Modifier words that alone do not identify a food ('Sweet lassi' is not 'Sweet Potato')
+_GENERIC_WORDS = frozenset(('black', 'fresh', 'green', 'powder', 'raw', 'red', 'seed', 'seeds',
+                            'sweet', 'white', 'whole'))
+
+# Allergy and dislike words that name a whole catalogue category
+_AVOID_CATEGORIES = {
+    'dairy': 'dairy', 'milk': 'dairy', 'lactose': 'dairy',
+    'nut': 'nuts', 'nuts': 'nuts', 'peanut': 'nuts', 'peanuts': 'nuts',
+    'legume': 'legumes', 'legumes': 'legumes', 'spice': 'spices', 'spices': 'spices',
+}
+
+# Meal item words that reveal a category the catalogue has no dish for
+_ITEM_CATEGORIES = dict(_AVOID_CATEGORIES, **{
+    word: 'dairy' for word in ('buttermilk', 'butter', 'cheese', 'cream', 'curd', 'ghee',
+                               'lassi', 'paneer', 'raita', 'yogurt')
+}, **{
+    word: 'nuts' for word in ('almond', 'almonds', 'cashew', 'cashews', 'pistachio',
+                              'pistachios', 'walnut', 'walnuts')
+})
+
+
+def _tokens(name):
+    return _TOKEN_RE.findall(name.lower())
+
+
+def _variants(token):
+    """A word and its naive singular/plural"""
+    return {token, token[:-1] if token.endswith('s') else token + 's'}
+
+
+class FoodCatalogue:
+    """
+    In-memory food catalogue with prefix, bitmap and range indexes
+
+    Rows are sorted by name, so row order is also result order and a row id
+    is a stable pagination cursor.
+    """
+
+    def __init__(self, items):
+        """
+        Args:
+            items (list): Food item dicts in the FoodDatabase format
+        """
+        items = sorted(items, key=lambda item: item['name'].lower())
+        self.size = len(items)
+
+        self.ids = [str(item.get('id', row)) for row, item in enumerate(items)]
+        self.names = [item['name'] for item in items]
+        self.descriptions = [item.get('description', '') for item in items]
+
+        self.numeric = {
+            column: np.array([float(item.get(column) or 0) for item in items], dtype=np.float32)
+            for column in NUMERIC_COLUMNS
+        }
+
+        # Dictionary-encoded columns: codes per row plus one vocabulary per column
+        self.vocab = {}
+        self.codes = {}
+        self.bitmaps = {}
+        dosha_effects = [item.get('doshaEffect') or {} for item in items]
+        for column in CATEGORICAL_COLUMNS + DOSHA_COLUMNS:
+            if column in DOSHA_COLUMNS:
+                values = [str(effect.get(column, 'Neutral')) for effect in dosha_effects]
+            else:
+                values = [str(item.get(column) or '') for item in items]
+            vocab = sorted(set(values))
+            lookup = {value: code for code, value in enumerate(vocab)}
+            codes = np.fromiter((lookup[value] for value in values), dtype=np.uint16, count=self.size)
+            self.vocab[column] = vocab
+            self.codes[column] = codes
+            self.bitmaps[column] = {value.lower(): codes == code for code, value in enumerate(vocab)}
+
+        self.multi_values = {}
+        for column in MULTI_VALUE_COLUMNS:
+            row_values = [tuple(item.get(column) or ()) for item in items]
+            self.multi_values[column] = row_values
+            value_rows = {}
+            for row, values in enumerate(row_values):
+                for value in values:
+                    value_rows.setdefault(value.lower(), []).append(row)
+            bitmaps = {}
+            for value, rows in value_rows.items():
+                bitmaps[value] = np.zeros(self.size, dtype=bool)
+                bitmaps[value][rows] = True
+            self.bitmaps[column] = bitmaps
+
+        # Prefix index: (token, row) pairs over every word of every name, sorted by token
+        token_rows = [(token, row) for row, name in enumerate(self.names) for token in _tokens(name)]
+        tokens = np.array([token for token, _ in token_rows], dtype=str)
+        order = np.argsort(tokens, kind='stable')
+        self._prefix_tokens = tokens[order].tolist()
+        self._prefix_rows = np.array([row for _, row in token_rows], dtype=np.int64)[order]
+        self._name_rows = {name.lower(): row for row, name in enumerate(self.names)}
+
+        self.load_seconds = None
+        self.source = None
+
+    @classmethod
+    def from_file(cls, path=None):
+        """
+        Load a catalogue from a JSON file (a list of food items)
+
+        Args:
+            path (str): Catalogue file. Defaults to FOOD_CATALOGUE_PATH or the bundled file.
+
+        Returns:
+            FoodCatalogue: The loaded catalogue, with load_seconds set
+        """
+        path = path or os.getenv('FOOD_CATALOGUE_PATH') or DEFAULT_CATALOGUE_PATH
+        started = time.perf_counter()
+        with open(path, encoding='utf-8') as f:
+            items = json.load(f)
+        catalogue = cls(items)
+        catalogue.load_seconds = time.perf_counter() - started
+        catalogue.source = path
+        return catalogue
+
+    def search(self, prefix=None, filters=None, ranges=None, cursor=None, limit=20):
+        """
+        Query the catalogue
+
+        Args:
+            prefix (str): Name autocomplete prefix; every word of the query must
+                          prefix-match a word of the name
+            filters (dict): Attribute -> value or list of values (OR within one
+                            attribute, AND across attributes), e.g.
+                            {'category': 'Grains', 'pitta': 'Pacifying'}
+            ranges (dict): Numeric column -> (min, max); either bound may be None
+            cursor (int): Row id of the last item of the previous page
+            limit (int): Page size
+
+        Returns:
+            tuple: (items, next_cursor or None, total matches)
+
+        Raises:
+            ValueError: For unknown filter or range columns
+        """
+        mask = np.ones(self.size, dtype=bool)
+
+        for column, values in (filters or {}).items():
+            if column not in self.bitmaps:
+                raise ValueError(f"Unknown filter: {column}")
+            if isinstance(values, str):
+                values = [values]
+            column_mask = np.zeros(self.size, dtype=bool)
+            for value in values:
+                bitmap = self.bitmaps[column].get(str(value).lower())
+                if bitmap is not None:
+                    column_mask |= bitmap
+            mask &= column_mask
+
+        for column, (low, high) in (ranges or {}).items():
+            if column not in self.numeric:
+                raise ValueError(f"Unknown range filter: {column}")
+            values = self.numeric[column]
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+
+        if prefix:
+            for token in _tokens(prefix):
+                mask &= self._prefix_mask(token)
+
+        rows = np.flatnonzero(mask)
+        total = len(rows)
+        if cursor is not None:
+            rows = rows[np.searchsorted(rows, cursor, side='right'):]
+        page = rows[:limit]
+        next_cursor = int(page[-1]) if len(rows) > limit else None
+        return [self.item(int(row)) for row in page], next_cursor, total
+
+    def item(self, row):
+        """Rebuild the food item dict for a row"""
+        item = {
+            'id': self.ids[row],
+            'name': self.names[row],
+            'description': self.descriptions[row],
+        }
+        for column in NUMERIC_COLUMNS:
+            item[column] = round(float(self.numeric[column][row]), 2)
+        for column in CATEGORICAL_COLUMNS:
+            item[column] = self.vocab[column][self.codes[column][row]]
+        for column in MULTI_VALUE_COLUMNS:
+            item[column] = list(self.multi_values[column][row])
+        item['doshaEffect'] = {
+            column: self.vocab[column][self.codes[column][row]] for column in DOSHA_COLUMNS
+        }
+        return item
+
+    def lookup(self, name):
+        """Return the item with exactly this name (case-insensitive), or None"""
+        row = self._name_rows.get(name.strip().lower())
+        return None if row is None else self.item(row)
+
+    def match(self, name, all_words=False):
+        """
+        Best catalogue item for a free-text meal item, matched on name words
+
+        'Rice' and 'Jeera rice' match 'Basmati Rice', 'Moong dal' matches
+        'Lentils (Moong Dal)'. The item sharing the most words wins, ties
+        going to the shorter catalogue name.
+
+        Args:
+            name (str): Meal item as written in a diet chart
+            all_words (bool): Only match if every word of the item is in the
+                              food's name ('Rice' but not 'Turmeric milk')
+
+        Returns:
+            dict: The matched food item, or None
+        """
+        row = self._match_row(name, all_words)
+        return None if row is None else self.item(row)
+
+    def avoid_mask(self, terms):
+        """
+        Bitmap of foods hit by any allergy or dislike term
+
+        A term excludes its whole category ('Dairy', 'Nuts', 'Milk') and
+        every food sharing a name word with it ('Almond', 'Moong dal').
+
+        Args:
+            terms (list): Allergies and disliked foods as the patient wrote them
+
+        Returns:
+            numpy.ndarray: Boolean mask over catalogue rows
+        """
+        mask = np.zeros(self.size, dtype=bool)
+        categories = self.bitmaps['category']
+        for term in terms:
+            words = [token for token in _tokens(str(term)) if token not in _GENERIC_WORDS]
+            for word in words:
+                for variant in _variants(word):
+                    category = _AVOID_CATEGORIES.get(variant, variant)
+                    if category in categories:
+                        mask |= categories[category]
+                mask[list(self._word_rows(word))] = True
+        return mask
+
+    def avoided_items(self, items, terms):
+        """
+        Meal items that contain something on the patient's avoid list
+
+        An item is flagged if it shares a word with an avoid term ('Peanut
+        chutney' for 'Peanuts'), names an avoided category ('Cucumber raita'
+        for 'Dairy'), or contains a catalogue food in avoid_mask ('Almond
+        milk' for 'Nuts').
+
+        Args:
+            items (list): Meal item names
+            terms (list): Allergies and disliked foods
+
+        Returns:
+            list: The flagged item names, in input order
+        """
+        if not terms:
+            return []
+        mask = self.avoid_mask(terms)
+        avoid_words = {
+            variant
+            for term in terms for token in _tokens(str(term)) if token not in _GENERIC_WORDS
+            for variant in _variants(token)
+        }
+        avoid_categories = {_AVOID_CATEGORIES.get(word, word) for word in avoid_words}
+        flagged = []
+        for item in items:
+            words = set(_tokens(item))
+            if (words & avoid_words
+                    or any(_ITEM_CATEGORIES.get(word) in avoid_categories for word in words)
+                    or any(mask[row] for row in self._item_rows(words))):
+                flagged.append(item)
+        return flagged
+
+    def pacifying_foods(self, dosha, exclude=(), exclude_categories=(), limit=25):
+        """
+        Names of foods that pacify every dosha in `dosha` (e.g. 'Vata-Pitta')
+
+        Args:
+            dosha (str): Dosha or hyphenated combination
+            exclude (list): Food names to leave out (allergies, dislikes)
+            exclude_categories (list): Categories to leave out (e.g. Dairy for vegans)
+            limit (int): Maximum number of names
+
+        Returns:
+            list: Food names
+        """
+        filters = {d: 'Pacifying' for d in _tokens(dosha) if d in DOSHA_COLUMNS}
+        mask = np.ones(self.size, dtype=bool)
+        for column, value in filters.items():
+            mask &= self.bitmaps[column].get(value.lower(), np.zeros(self.size, dtype=bool))
+        for category in exclude_categories:
+            bitmap = self.bitmaps['category'].get(category.lower())
+            if bitmap is not None:
+                mask &= ~bitmap
+        if exclude:
+            mask &= ~self.avoid_mask(exclude)
+        return [self.names[row] for row in np.flatnonzero(mask)[:limit]]
+
+    def stats(self):
+        return {
+            'items': self.size,
+            'source': self.source,
+            'loadSeconds': round(self.load_seconds, 4) if self.load_seconds is not None else None,
+            'bytes': int(sum(a.nbytes for a in self.numeric.values())
+                         + sum(a.nbytes for a in self.codes.values())
+                         + self._prefix_rows.nbytes)
+        }
+
+    def _match_row(self, name, all_words=False):
+        row = self._name_rows.get(name.strip().lower())
+        if row is not None:
+            return row
+        words = [token for token in _tokens(name) if token not in _GENERIC_WORDS]
+        shared = {}
+        for token in words:
+            for word_row in self._word_rows(token):
+                shared[word_row] = shared.get(word_row, 0) + 1
+        if not shared:
+            return None
+        row = max(shared, key=lambda r: (shared[r], -len(self.names[r]), -r))
+        if all_words and shared[row] < len(words):
+            return None
+        return row
+
+    def _item_rows(self, words):
+        """Rows sharing any non-generic word with an item"""
+        rows = set()
+        for word in words:
+            if word not in _GENERIC_WORDS:
+                rows |= self._word_rows(word)
+        return rows
+
+    def _word_rows(self, token):
+        """Rows with a name word equal to token (or its singular/plural)"""
+        rows = set()
+        for word in _variants(token):
+            start = bisect.bisect_left(self._prefix_tokens, word)
+            end = bisect.bisect_right(self._prefix_tokens, word, lo=start)
+            rows.update(self._prefix_rows[start:end].tolist())
+        return rows
+
+    def _prefix_mask(self, token):
+        start = bisect.bisect_left(self._prefix_tokens, token)
+        end = bisect.bisect_left(self._prefix_tokens, token + '\uffff', lo=start)
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self._prefix_rows[start:end]] = True
+        return mask
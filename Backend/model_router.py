@@ -0,0 +1,275 @@
+"""
+model_router.py -
+Latency-Budgeted Model Routing Module
+Chooses the Gemini model tier and output-token cap for each request type from
+observed latency and response-size history, downgrading to a lighter tier (or
+shedding the request) when the upstream p95 latency exceeds the request's budget.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+
+
+# Model name returned when every tier is over budget and shedding is enabled
+SHED = 'shed'
+
+# Gemini 2.5 Flash/Pro think by default and spend those tokens out of
+# max_output_tokens; the pinned SDK cannot set a thinking budget, so their
+# tiers always get at least this cap
+THINKING_MIN_OUTPUT_TOKENS = 8192
+
+
+def is_thinking_model(model_name):
+    """True for models that think by default (Flash-Lite does not)"""
+    return model_name.startswith('gemini-2.5-') and 'lite' not in model_name
+
+
+def tier(model_name, answer_tokens):
+    """(model_name, max_output_tokens) with thinking headroom where the model needs it"""
+    if is_thinking_model(model_name):
+        return model_name, max(answer_tokens, THINKING_MIN_OUTPUT_TOKENS)
+    return model_name, answer_tokens
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile (nearest rank) of a list of numbers"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100.0 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+class RoutePolicy:
+    """
+    Routing settings for one request type
+    """
+
+    def __init__(self, request_type, tiers, latency_budget, temperature=0.7,
+                 min_output_tokens=1024):
+        """
+        Args:
+            request_type (str): e.g. 'full_week', 'single_day' or 'single_meal'
+            tiers (list): (model_name, max_output_tokens) pairs, preferred first
+            latency_budget (float): Acceptable p95 latency in seconds
+            temperature (float): Sampling temperature for this request type
+            min_output_tokens (int): Floor for the adaptive output-token cap
+        """
+        self.request_type = request_type
+        self.tiers = tiers
+        self.latency_budget = latency_budget
+        self.temperature = temperature
+        self.min_output_tokens = min_output_tokens
+
+
+class RouteDecision:
+    """
+    Model and generation settings chosen for one call
+    """
+
+    def __init__(self, request_type, model_name, generation_config, reason, tier_output_tokens=None):
+        self.request_type = request_type
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.reason = reason
+        # The tier's full output-token cap, for retrying a truncated response
+        self.tier_output_tokens = tier_output_tokens or generation_config['max_output_tokens']
+
+
+class ModelRouter:
+    """
+    Picks a model tier and output-token cap per request type
+    """
+
+    # Headroom applied to the p95 observed output size when capping tokens
+    OUTPUT_HEADROOM = 1.25
+    # Samples needed before latency or size history is trusted
+    MIN_SAMPLES = 5
+
+    def __init__(self, policies, window=20, probe_every=10, shed_over_budget=False,
+                 sample_ttl=300.0):
+        """
+        Args:
+            policies (list): RoutePolicy instances, one per request type
+            window (int): Latency/size samples kept per model and request type
+            probe_every (int): While downgraded or shedding, send every Nth
+                               request to one of the other tiers, in rotation,
+                               so their latency history stays fresh
+            shed_over_budget (bool): Route to SHED when every tier is over
+                                     budget (otherwise use the fastest tier)
+            sample_ttl (float): Seconds a latency sample counts towards p95; a
+                                tier without recent traffic is trusted again
+        """
+        self.policies = {p.request_type: p for p in policies}
+        self.window = window
+        self.probe_every = probe_every
+        self.shed_over_budget = shed_over_budget
+        self.sample_ttl = sample_ttl
+        self._lock = threading.Lock()
+
+        self._latency = {}       # (request_type, model_name) -> deque of (monotonic time, seconds)
+        self._output_tokens = {}  # (request_type, model_name) -> deque of tokens
+        self._downgraded_calls = {}
+        self._probe_cursor = {}
+        self._route_counts = {}
+        self._errors = {}
+        self._truncations = {}
+
+    def route(self, request_type):
+        """
+        Choose the model and generation config for a request
+
+        Args:
+            request_type (str): A configured request type
+
+        Returns:
+            RouteDecision: The chosen route
+        """
+        policy = self.policies[request_type]
+        with self._lock:
+            model_name, reason = self._pick_tier(policy)
+            tier_cap = policy.tiers[0][1] if model_name == SHED else dict(policy.tiers)[model_name]
+            max_tokens = tier_cap if model_name == SHED else self._output_cap(policy, model_name, tier_cap)
+            key = f"{model_name}:{reason}"
+            counts = self._route_counts.setdefault(request_type, {})
+            counts[key] = counts.get(key, 0) + 1
+
+        generation_config = {
+            'temperature': policy.temperature,
+            'top_p': 0.95,
+            'top_k': 40,
+            'max_output_tokens': max_tokens,
+        }
+        return RouteDecision(request_type, model_name, generation_config, reason, tier_cap)
+
+    def record(self, decision, latency, output_tokens=None, ok=True, truncated=False):
+        """
+        Record the outcome of a routed call
+
+        Args:
+            decision (RouteDecision): Decision returned by route()
+            latency (float): Seconds the call took
+            output_tokens (int): Output tokens the call spent, including any
+                                 thinking tokens (they count against max_output_tokens)
+            ok (bool): False if the call raised
+            truncated (bool): True if the response hit the output-token cap
+        """
+        with self._lock:
+            if decision.model_name != SHED:
+                samples = self._samples(self._latency, (decision.request_type, decision.model_name))
+                budget = self.policies[decision.request_type].latency_budget
+                if decision.reason == 'probe' and ok and latency <= budget:
+                    # A healthy probe supersedes the slow history that made the
+                    # tier avoided, so traffic returns to it right away
+                    samples.clear()
+                samples.append((time.monotonic(), latency))
+            if not ok:
+                self._bump(self._errors, decision.request_type)
+            elif truncated:
+                # The adaptive cap was too tight; start over from the tier's full cap
+                self._bump(self._truncations, decision.request_type)
+                self._output_tokens.pop((decision.request_type, decision.model_name), None)
+            elif output_tokens:
+                # Per model: a thinking tier's output is much larger than a non-thinking one's
+                self._samples(self._output_tokens, (decision.request_type, decision.model_name)).append(output_tokens)
+
+    def stats(self):
+        """Return route counts and latency/size history for the health endpoint"""
+        with self._lock:
+            return {
+                'routes': {rt: dict(counts) for rt, counts in self._route_counts.items()},
+                'errors': dict(self._errors),
+                'truncations': dict(self._truncations),
+                'latencyP95': {
+                    f"{rt}:{model}": round(percentile([latency for _, latency in samples], 95), 3)
+                    for (rt, model), samples in self._latency.items() if samples
+                },
+                'outputTokensP95': {
+                    f"{rt}:{model}": percentile(list(samples), 95)
+                    for (rt, model), samples in self._output_tokens.items() if samples
+                },
+                'budgets': {rt: p.latency_budget for rt, p in self.policies.items()}
+            }
+
+    def _pick_tier(self, policy):
+        for index, (model_name, _) in enumerate(policy.tiers):
+            p95 = self._p95(policy.request_type, model_name)
+            if p95 is None or p95 <= policy.latency_budget:
+                if index == 0:
+                    self._downgraded_calls[policy.request_type] = 0
+                    return model_name, 'preferred'
+                return self._maybe_probe(policy, model_name, 'downgrade')
+
+        if self.shed_over_budget:
+            return self._maybe_probe(policy, SHED, 'over_budget')
+        fastest = min(policy.tiers, key=lambda tier: self._p95(policy.request_type, tier[0]))[0]
+        return self._maybe_probe(policy, fastest, 'over_budget')
+
+    def _maybe_probe(self, policy, model_name, reason):
+        """Every probe_every-th call goes to the next other tier in rotation"""
+        calls = self._downgraded_calls.get(policy.request_type, 0) + 1
+        self._downgraded_calls[policy.request_type] = calls
+        others = [name for name, _ in policy.tiers if name != model_name]
+        if self.probe_every and others and calls % self.probe_every == 0:
+            cursor = self._probe_cursor.get(policy.request_type, 0)
+            self._probe_cursor[policy.request_type] = cursor + 1
+            return others[cursor % len(others)], 'probe'
+        return model_name, reason
+
+    def _output_cap(self, policy, model_name, tier_cap):
+        samples = self._output_tokens.get((policy.request_type, model_name))
+        if not samples or len(samples) < self.MIN_SAMPLES:
+            return tier_cap
+        cap = math.ceil(percentile(list(samples), 95) * self.OUTPUT_HEADROOM)
+        return max(policy.min_output_tokens, min(cap, tier_cap))
+
+    def _p95(self, request_type, model_name):
+        # Latency depends heavily on output size, so each request type has its own history
+        samples = self._latency.get((request_type, model_name)) or ()
+        cutoff = time.monotonic() - self.sample_ttl
+        recent = [latency for recorded_at, latency in samples if recorded_at >= cutoff]
+        if len(recent) < self.MIN_SAMPLES:
+            return None
+        return percentile(recent, 95)
+
+    def _samples(self, store, key):
+        if key not in store:
+            store[key] = deque(maxlen=self.window)
+        return store[key]
+
+    def _bump(self, store, key):
+        store[key] = store.get(key, 0) + 1
+
+
+def build_default_router(shed_over_budget=False):
+    """
+    Build the router used by DietChartGenerator from environment settings
+
+    Full-week charts prefer the main model; single-day and single-meal
+    regeneration prefer the lighter model with much smaller output budgets.
+    Thinking-model tiers keep THINKING_MIN_OUTPUT_TOKENS so thinking cannot
+    use up a small answer budget.
+
+    Args:
+        shed_over_budget (bool): Shed requests instead of calling an over-budget tier
+    """
+    main_model = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+    light_model = os.getenv('GEMINI_LIGHT_MODEL', 'gemini-2.5-flash-lite')
+    policies = [
+        RoutePolicy('full_week',
+                    tiers=[tier(main_model, 8192), tier(light_model, 8192)],
+                    latency_budget=float(os.getenv('ROUTER_FULL_WEEK_BUDGET', '45')),
+                    min_output_tokens=4096),
+        RoutePolicy('single_day',
+                    tiers=[tier(light_model, 2048), tier(main_model, 2048)],
+                    latency_budget=float(os.getenv('ROUTER_SINGLE_DAY_BUDGET', '15')),
+                    min_output_tokens=1024),
+        RoutePolicy('single_meal',
+                    tiers=[tier(light_model, 512), tier(main_model, 512)],
+                    latency_budget=float(os.getenv('ROUTER_SINGLE_MEAL_BUDGET', '8')),
+                    min_output_tokens=256),
+    ]
+    return ModelRouter(policies, shed_over_budget=shed_over_budget)
@@ -0,0 +1,419 @@
+"""
+nutrition_analytics.py -
+Nutrition Analytics Module
+Flattens saved diet charts into columnar NumPy arrays as they are saved,
+recomputes meal and day calorie totals server-side (from the stated meal
+calories and, where every item is a catalogue food, from the food catalogue),
+flags mismatches, estimates macros from the catalogue foods a meal contains,
+and keeps per-cohort rollups so cohort queries never re-parse JSON.
+"""
+
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from chart_store import parse_day_number
+
+
+# Profile fields that define a cohort
+COHORT_FIELDS = ('dosha', 'dietType', 'weightGoal')
+
+# Meal slots in the order DietChartGenerator emits them
+MEAL_SLOTS = ('earlyMorning', 'breakfast', 'midMorning', 'lunch', 'eveningSnack', 'dinner', 'beforeBed')
+
+# Day totals within this many kcal (or this fraction) of the meal sum are consistent
+DAY_TOLERANCE_KCAL = 25.0
+DAY_TOLERANCE_RATIO = 0.05
+
+# Catalogue values are per 100 g; one meal item is assumed to be a typical
+# serving of its category (a pinch of spice, a spoon of ghee, a bowl of rice)
+PORTION_GRAMS = {
+    'Spices': 2,
+    'Dairy': 10,
+    'Nuts': 20,
+    'Legumes': 40,    # dry weight of one bowl of dal
+    'Fruits': 100,
+    'Vegetables': 100,
+    'Grains': 150,    # cooked
+}
+DEFAULT_PORTION_GRAMS = 100
+
+# Portions are typical, not measured, so estimates are only flagged when they
+# disagree with the model by a wide margin
+CATALOGUE_TOLERANCE_RATIO = 0.5
+
+# Distinct meal item names whose catalogue match is memoized
+MATCH_CACHE_SIZE = 10000
+
+# Per-group rollup vector layout
+_ROLLUP = ('charts', 'days', 'statedDayCalories', 'mealCalories', 'dayMismatches',
+           'catalogueMeals', 'catalogueCalories', 'statedCatalogueCalories',
+           'catalogueMismatches', 'items', 'matchedItems', 'protein', 'carbs', 'fat')
+_R = {name: index for index, name in enumerate(_ROLLUP)}
+
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+_MAX_DAY = np.iinfo(np.int8).max
+
+
+def cohort_profile(profile):
+    """The patient payload fields that place a chart in a cohort"""
+    profile = profile or {}
+    return {key: profile.get(key) for key in ('dominantDosha', 'dietType', 'weightGoal')}
+
+
+def _number(value):
+    """Parse a calorie value the model may have written as a number or a string"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.search(str(value or ''))
+    return float(match.group()) if match else np.nan
+
+
+class _ColumnTable:
+    """Append-only table of NumPy columns with amortized growth"""
+
+    def __init__(self, dtypes, capacity=1024):
+        self.size = 0
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in dtypes.items()}
+
+    def append(self, rows):
+        """Append a batch given as {column: sequence} of equal lengths; returns (start, end)"""
+        count = len(next(iter(rows.values())))
+        start, end = self.size, self.size + count
+        capacity = len(next(iter(self.columns.values())))
+        if end > capacity:
+            new_capacity = max(end, capacity * 2)
+            for name, column in self.columns.items():
+                grown = np.zeros(new_capacity, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                self.columns[name] = grown
+        for name, values in rows.items():
+            self.columns[name][start:end] = values
+        self.size = end
+        return start, end
+
+    def view(self):
+        return {name: column[:self.size] for name, column in self.columns.items()}
+
+
+class NutritionAnalytics:
+    """
+    Columnar store of saved chart meals with precomputed cohort rollups
+    """
+
+    def __init__(self, food_catalogue=None):
+        """
+        Args:
+            food_catalogue (FoodCatalogue): Used to estimate meal calories and macros
+        """
+        self.food_catalogue = food_catalogue
+        self._lock = threading.Lock()
+        self._matches = {}  # item name -> (per-portion nutrients or None, whole-name match)
+
+        self.meals = _ColumnTable({
+            'chart': np.int32, 'day': np.int8, 'slot': np.int8, 'active': bool,
+            'statedCalories': np.float32, 'catalogueCalories': np.float32,
+            'protein': np.float32, 'carbs': np.float32, 'fat': np.float32,
+            'items': np.int16, 'matchedItems': np.int16
+        })
+        self.days = _ColumnTable({
+            'chart': np.int32, 'day': np.int8, 'active': bool,
+            'statedTotal': np.float32, 'mealTotal': np.float32, 'mismatch': bool
+        })
+
+        self._chart_index = {}    # chart id -> int
+        self._chart_ids = []
+        self._chart_rows = {}     # chart int -> ((meal start, end), (day start, end))
+        self._chart_contrib = {}  # chart int -> (cohort key, rollup vector)
+        self._chart_versions = {}  # chart int -> stored chart version last ingested
+        self._rollups = {}        # cohort key -> rollup vector
+
+    def add_chart(self, chart_id, diet_chart, profile, version=None):
+        """
+        Flatten a saved chart into the columnar tables and update rollups
+
+        Saving the same chart id again replaces its previous rows. When a
+        store version is given, versions older than the one already ingested
+        are ignored, so concurrent writers cannot roll the rows back.
+
+        Args:
+            chart_id (str): Identifier of the chart (e.g. the patient id)
+            diet_chart (dict): Diet chart with a weeklyPlan
+            profile (dict): Patient payload with dominantDosha, dietType, weightGoal
+            version (int): ChartStore version of diet_chart, if stored
+        """
+        cohort = tuple(str(value or 'Unknown') for value in cohort_profile(profile).values())
+        meal_rows, day_rows = self._flatten(diet_chart)
+
+        with self._lock:
+            chart = self._chart_index.get(chart_id)
+            if version is not None and chart is not None and version <= self._chart_versions.get(chart, 0):
+                return
+            if chart is None:
+                chart = len(self._chart_ids)
+                self._chart_index[chart_id] = chart
+                self._chart_ids.append(chart_id)
+            else:
+                self._retire(chart)
+
+            meal_rows['chart'] = np.full(len(meal_rows['day']), chart, dtype=np.int32)
+            day_rows['chart'] = np.full(len(day_rows['day']), chart, dtype=np.int32)
+            meal_span = self.meals.append(meal_rows)
+            day_span = self.days.append(day_rows)
+            self._chart_rows[chart] = (meal_span, day_span)
+            if version is not None:
+                self._chart_versions[chart] = version
+
+            contribution = self._contribution(meal_rows, day_rows)
+            self._chart_contrib[chart] = (cohort, contribution)
+            self._rollups.setdefault(cohort, np.zeros(len(_ROLLUP)))
+            self._rollups[cohort] += contribution
+
+    def chart_report(self, chart_id):
+        """
+        Server-side totals and mismatch flags for one chart
+
+        Returns:
+            dict: Per-day stated vs recomputed totals, or None for unknown charts
+        """
+        with self._lock:
+            chart = self._chart_index.get(chart_id)
+            if chart is None:
+                return None
+            (meal_start, meal_end), (day_start, day_end) = self._chart_rows[chart]
+            meals = {name: column[meal_start:meal_end].copy() for name, column in self.meals.view().items()}
+            days = {name: column[day_start:day_end].copy() for name, column in self.days.view().items()}
+
+        report = []
+        for index in range(len(days['day'])):
+            day_mask = meals['day'] == days['day'][index]
+            catalogue = meals['catalogueCalories'][day_mask]
+            stated = meals['statedCalories'][day_mask]
+            known = ~np.isnan(catalogue)
+            items = int(meals['items'][day_mask].sum())
+            report.append({
+                'day': int(days['day'][index]),
+                'statedTotalCalories': _json_float(days['statedTotal'][index]),
+                'mealCaloriesTotal': _json_float(days['mealTotal'][index]),
+                'totalMismatch': bool(days['mismatch'][index]),
+                'catalogueEstimate': {
+                    'itemCoverage': round(int(meals['matchedItems'][day_mask].sum()) / items, 3) if items else None,
+                    'mealsEstimated': int(known.sum()),
+                    'calories': _json_float(catalogue[known].sum()),
+                    'statedCalories': _json_float(stated[known].sum())
+                }
+            })
+        return {'chartId': chart_id, 'days': report}
+
+    def cohorts(self, group_by=COHORT_FIELDS, filters=None):
+        """
+        Aggregate precomputed rollups by cohort
+
+        Args:
+            group_by (list): Subset of COHORT_FIELDS to group on
+            filters (dict): COHORT_FIELDS value filters (case-insensitive)
+
+        Returns:
+            list: One dict per group with averages, mismatch rates and macro split
+
+        Raises:
+            ValueError: For unknown group or filter fields
+        """
+        for field in list(group_by) + list(filters or {}):
+            if field not in COHORT_FIELDS:
+                raise ValueError(f"Unknown cohort field: {field}")
+        positions = [COHORT_FIELDS.index(field) for field in group_by]
+        wanted = {COHORT_FIELDS.index(field): str(value).lower() for field, value in (filters or {}).items()}
+
+        groups = {}
+        with self._lock:
+            for cohort, vector in self._rollups.items():
+                if any(cohort[position].lower() != value for position, value in wanted.items()):
+                    continue
+                key = tuple(cohort[position] for position in positions)
+                groups[key] = groups.get(key, 0) + vector
+
+        results = []
+        for key, vector in sorted(groups.items()):
+            if not vector[_R['charts']]:
+                continue
+            row = dict(zip(group_by, key))
+            row.update(_summarize(vector))
+            results.append(row)
+        return results
+
+    def meals_frame(self):
+        """Return the active meal rows as a pandas DataFrame for ad-hoc analysis"""
+        with self._lock:
+            view = {name: column.copy() for name, column in self.meals.view().items()}
+            chart_ids = np.array(self._chart_ids, dtype=object)
+            cohorts = [self._chart_contrib[chart][0] for chart in range(len(self._chart_ids))]
+        active = view.pop('active')
+        frame = pd.DataFrame({name: column[active] for name, column in view.items()})
+        frame['slot'] = pd.Categorical.from_codes(frame['slot'], ['other'] + list(MEAL_SLOTS))
+        cohort_table = pd.DataFrame(cohorts, columns=list(COHORT_FIELDS))
+        frame = frame.join(cohort_table, on='chart')
+        frame['chart'] = chart_ids[frame['chart'].to_numpy()]
+        return frame
+
+    def stats(self):
+        with self._lock:
+            return {
+                'charts': len(self._chart_ids),
+                'mealRows': self.meals.size,
+                'dayRows': self.days.size,
+                'cohorts': len(self._rollups)
+            }
+
+    def _flatten(self, diet_chart):
+        """Turn a chart's weeklyPlan into meal and day column batches"""
+        meal_rows = {name: [] for name in ('day', 'slot', 'statedCalories', 'catalogueCalories',
+                                          'protein', 'carbs', 'fat', 'items', 'matchedItems')}
+        day_rows = {name: [] for name in ('day', 'statedTotal', 'mealTotal', 'mismatch')}
+
+        for position, day in enumerate(diet_chart.get('weeklyPlan') or []):
+            if not isinstance(day, dict):
+                continue
+            # Day columns are int8; out-of-range numbers are clamped rather than overflowing
+            day_number = min(max(parse_day_number(day.get('day'), position), 0), _MAX_DAY)
+            meal_total = 0.0
+            for slot_name, meal in (day.get('meals') or {}).items():
+                if not isinstance(meal, dict):
+                    continue
+                items = [item for item in (meal.get('items') or []) if isinstance(item, str)]
+                stated = _number(meal.get('calories'))
+                calories, protein, carbs, fat, matched = self._estimate(items)
+                meal_rows['day'].append(day_number)
+                meal_rows['slot'].append(MEAL_SLOTS.index(slot_name) + 1 if slot_name in MEAL_SLOTS else 0)
+                meal_rows['statedCalories'].append(stated)
+                meal_rows['catalogueCalories'].append(calories)
+                meal_rows['protein'].append(protein)
+                meal_rows['carbs'].append(carbs)
+                meal_rows['fat'].append(fat)
+                meal_rows['items'].append(len(items))
+                meal_rows['matchedItems'].append(matched)
+                if not np.isnan(stated):
+                    meal_total += stated
+
+            stated_total = _number(day.get('totalCalories'))
+            gap = abs(stated_total - meal_total)
+            mismatch = bool(np.isnan(stated_total)
+                            or gap > max(DAY_TOLERANCE_KCAL, DAY_TOLERANCE_RATIO * meal_total))
+            day_rows['day'].append(day_number)
+            day_rows['statedTotal'].append(stated_total)
+            day_rows['mealTotal'].append(meal_total)
+            day_rows['mismatch'].append(mismatch)
+
+        meal_rows['active'] = [True] * len(meal_rows['day'])
+        day_rows['active'] = [True] * len(day_rows['day'])
+        return meal_rows, day_rows
+
+    def _estimate(self, items):
+        """
+        Catalogue calories and macros for a meal
+
+        Macros cover every item that contains a catalogue food ('Turmeric
+        milk' counts its turmeric). Calories are NaN unless every item is a
+        catalogue food, since a partial sum cannot be compared with the
+        stated meal calories.
+        """
+        if self.food_catalogue is None or not items:
+            return np.nan, 0.0, 0.0, 0.0, 0
+        totals = np.zeros(4)
+        matched = 0
+        complete = True
+        for name in items:
+            nutrients, whole = self._match(name)
+            if nutrients is None:
+                complete = False
+                continue
+            matched += 1
+            complete = complete and whole
+            totals += nutrients
+        calories = totals[0] if complete else np.nan
+        return calories, totals[1], totals[2], totals[3], matched
+
+    def _match(self, name):
+        """Memoized catalogue match: (calories/protein/carbs/fat of one portion, whole-name match)"""
+        key = name.strip().lower()
+        cached = self._matches.get(key)
+        if cached is not None:
+            return cached
+        food = self.food_catalogue.match(name)
+        if food is None:
+            cached = (None, False)
+        else:
+            grams = PORTION_GRAMS.get(food['category'], DEFAULT_PORTION_GRAMS)
+            nutrients = np.array((food['calories'], food['protein'], food['carbs'], food['fat'])) * grams / 100.0
+            cached = (nutrients, self.food_catalogue.match(name, all_words=True) is not None)
+        if len(self._matches) >= MATCH_CACHE_SIZE:
+            self._matches.clear()
+        self._matches[key] = cached
+        return cached
+
+    def _contribution(self, meal_rows, day_rows):
+        """Rollup vector contributed by one chart's rows"""
+        vector = np.zeros(len(_ROLLUP))
+        stated = np.asarray(meal_rows['statedCalories'], dtype=np.float64)
+        catalogue = np.asarray(meal_rows['catalogueCalories'], dtype=np.float64)
+        known = ~np.isnan(catalogue)
+        catalogue_mismatch = known & ~np.isnan(stated) & (
+            np.abs(catalogue - np.nan_to_num(stated)) > CATALOGUE_TOLERANCE_RATIO * np.nan_to_num(stated))
+
+        vector[_R['charts']] = 1
+        vector[_R['days']] = len(day_rows['day'])
+        vector[_R['statedDayCalories']] = np.nansum(np.asarray(day_rows['statedTotal'], dtype=np.float64))
+        vector[_R['mealCalories']] = np.sum(np.asarray(day_rows['mealTotal'], dtype=np.float64))
+        vector[_R['dayMismatches']] = np.sum(day_rows['mismatch'])
+        vector[_R['catalogueMeals']] = known.sum()
+        vector[_R['catalogueCalories']] = catalogue[known].sum()
+        vector[_R['statedCatalogueCalories']] = np.nansum(stated[known])
+        vector[_R['catalogueMismatches']] = catalogue_mismatch.sum()
+        vector[_R['items']] = np.sum(meal_rows['items'])
+        vector[_R['matchedItems']] = np.sum(meal_rows['matchedItems'])
+        for macro in ('protein', 'carbs', 'fat'):
+            vector[_R[macro]] = np.sum(np.asarray(meal_rows[macro], dtype=np.float64))
+        return vector
+
+    def _retire(self, chart):
+        """Deactivate a chart's previous rows and remove it from the rollups"""
+        (meal_start, meal_end), (day_start, day_end) = self._chart_rows[chart]
+        self.meals.columns['active'][meal_start:meal_end] = False
+        self.days.columns['active'][day_start:day_end] = False
+        cohort, contribution = self._chart_contrib.pop(chart)
+        self._rollups[cohort] -= contribution
+
+
+def _summarize(vector):
+    vector = vector.tolist()
+    days = vector[_R['days']]
+    catalogue_meals = vector[_R['catalogueMeals']]
+    items = vector[_R['items']]
+    protein_kcal = vector[_R['protein']] * 4
+    carbs_kcal = vector[_R['carbs']] * 4
+    fat_kcal = vector[_R['fat']] * 9
+    macro_kcal = protein_kcal + carbs_kcal + fat_kcal
+    return {
+        'charts': int(vector[_R['charts']]),
+        'days': int(days),
+        'avgDailyCalories': round(vector[_R['mealCalories']] / days, 1) if days else None,
+        'avgStatedDailyCalories': round(vector[_R['statedDayCalories']] / days, 1) if days else None,
+        'dayTotalMismatchRate': round(vector[_R['dayMismatches']] / days, 4) if days else None,
+        'catalogueItemCoverage': round(vector[_R['matchedItems']] / items, 3) if items else None,
+        'catalogueEstimatedMeals': int(catalogue_meals),
+        'catalogueMismatchRate': (round(vector[_R['catalogueMismatches']] / catalogue_meals, 4)
+                                  if catalogue_meals else None),
+        'macroSplit': {
+            'protein': round(protein_kcal / macro_kcal, 3),
+            'carbs': round(carbs_kcal / macro_kcal, 3),
+            'fat': round(fat_kcal / macro_kcal, 3)
+        } if macro_kcal else None
+    }
+
+
+def _json_float(value):
+    value = float(value)
+    return None if np.isnan(value) else round(value, 1)
@@ -0,0 +1,204 @@
+"""
+prompt_templates.py -
+Diet Chart Prompt Templates
+One template family for full-week, single-day and single-meal requests. The
+static part (role, JSON rules and the example schema) is built once and is
+identical for every request, and comes first so a provider-side prefix cache
+can reuse it; only a short profile and task block is assembled per request.
+"""
+
+import json
+import re
+import time
+
+
+DAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+MEAL_SLOTS = ('earlyMorning', 'breakfast', 'midMorning', 'lunch', 'eveningSnack', 'dinner', 'beforeBed')
+
+# First line of every dynamic block; lets stubs and logs tell request types apart
+REQUEST_TYPE_RE = re.compile(r'^REQUEST TYPE: (\w+)', re.MULTILINE)
+
+
+def _meal(time_of_day, items, description, calories, benefit):
+    return {
+        'time': time_of_day,
+        'items': items,
+        'description': description,
+        'calories': calories,
+        'ayurvedicBenefit': benefit
+    }
+
+
+# Example chart shown to the model; serialized compactly once at import
+_EXAMPLE_CHART = {
+    'weeklyPlan': [{
+        'day': 1,
+        'dayName': 'Monday',
+        'meals': {
+            'earlyMorning': _meal('6:00 AM', ['Warm lemon water'],
+                                  'Start your day with 1 glass warm water mixed with half lemon', 10,
+                                  'Activates digestive fire and detoxifies body'),
+            'breakfast': _meal('8:00 AM', ['Oats porridge', 'Dates', 'Herbal tea'],
+                               '1 bowl oats cooked with 3-4 chopped dates and cup of ginger tea', 400,
+                               'Balances the dosha and provides sustained energy'),
+            'midMorning': _meal('11:00 AM', ['Apple', 'Almonds'],
+                                '1 medium apple with 5-6 soaked almonds', 150,
+                                'Natural energy boost and healthy fats'),
+            'lunch': _meal('1:00 PM', ['Dal', 'Rice', 'Vegetable curry', 'Salad', 'Buttermilk'],
+                           '1 bowl moong dal, 1 cup rice, mixed vegetable curry, cucumber salad, 1 glass buttermilk',
+                           600, 'Main meal during peak digestive fire'),
+            'eveningSnack': _meal('5:00 PM', ['Herbal tea', 'Roasted chickpeas'],
+                                  '1 cup ginger-cardamom tea with handful of roasted chana', 200,
+                                  'Light protein to prevent overeating at dinner'),
+            'dinner': _meal('7:30 PM', ['Khichdi', 'Cucumber raita'],
+                            '1 bowl moong dal khichdi with cooling cucumber yogurt', 450,
+                            'Easy to digest for restful sleep'),
+            'beforeBed': _meal('9:30 PM', ['Turmeric milk'],
+                               '1 glass warm milk with half teaspoon turmeric and honey', 100,
+                               'Promotes deep sleep and reduces inflammation')
+        },
+        'totalCalories': 1910,
+        'waterIntake': '8-10 glasses throughout the day',
+        'specialNotes': 'Start your day with light yoga or pranayama breathing'
+    }],
+    'doshaBalancingTips': [
+        'Eat warm and cooked foods to balance the dosha',
+        'Maintain regular meal times to strengthen digestive fire'
+    ],
+    'lifestyleRecommendations': [
+        'Wake up before sunrise ideally around 6 AM',
+        'Take a 15-minute walk after lunch for digestion'
+    ],
+    'ayurvedicSupplements': [{
+        'name': 'Triphala',
+        'benefit': 'Supports healthy digestion and gentle detoxification',
+        'timing': 'Take before bed with warm water'
+    }],
+    'importantReminders': [
+        'Eat mindfully without phone or TV distractions',
+        'Drink water between meals not during meals'
+    ]
+}
+
+STATIC_PREFIX = f"""You are an expert Ayurvedic nutritionist creating Indian diet plans as PURE JSON with NO markdown formatting.
+
+JSON RULES:
+1. Items array: Use ONLY simple food names - NO parentheses, NO measurements
+2. Measurements go in the description field
+3. NO special characters or quotes inside strings
+4. Keep strings SHORT and SIMPLE
+5. Meals use exactly these keys: {', '.join(MEAL_SLOTS)}
+6. Each meal has time, items, description, calories (a number) and ayurvedicBenefit
+7. totalCalories of a day is the sum of its meal calories
+8. Return ONLY the JSON object - absolutely NO markdown, NO backticks
+
+FULL CHART FORMAT (one day shown; lists shortened):
+{json.dumps(_EXAMPLE_CHART, separators=(',', ':'))}
+
+PLANNING RULES:
+1. ALL meals MUST follow the user's diet type - NO exceptions
+2. NEVER include anything from the user's MUST AVOID list
+3. Adjust calories to the user's weight goal
+4. Use ingredients and spices that balance the user's dosha
+5. Prefer the user's recommended foods when they fit
+
+The user profile and the exact request follow.
+"""
+
+_PROFILE_FORMAT = """USER PROFILE:
+- Dosha: {dosha}
+- Diet Type: {diet_type}
+- MUST AVOID: {avoid}
+- Health Goals: {health_goals}
+- Health Conditions: {health_conditions}
+- Age: {age}, Weight: {weight}kg, Activity: {activity_level}
+- Weight Goal: {weight_goal}
+- Recommended Foods: {recommended}
+"""
+
+_TASK_FORMATS = {
+    'full_week': (
+        "Generate 7 DIFFERENT days (day 1 to 7, Monday to Sunday) and return the full chart "
+        "object with every top-level key."
+    ),
+    'single_day': (
+        "Generate ONLY day {day_number} ({day_name}). Return {{\"weeklyPlan\": [<that one day>]}} "
+        "with day set to {day_number} and no other top-level keys."
+    ),
+    'single_meal': (
+        "Generate ONLY the {meal_name} meal for day {day_number} ({day_name}). "
+        "Return {{\"meal\": <that one meal object>}} and nothing else."
+    ),
+}
+
+
+class PromptParts:
+    """
+    A rendered prompt split into its cacheable and per-request parts
+    """
+
+    def __init__(self, request_type, static, dynamic, assembly_seconds):
+        self.request_type = request_type
+        self.static = static
+        self.dynamic = dynamic
+        self.assembly_seconds = assembly_seconds
+
+    @property
+    def text(self):
+        """The complete prompt, for models without a context cache"""
+        return self.static + self.dynamic
+
+
+def estimate_tokens(text):
+    """Rough Gemini token count (about 4 characters per token)"""
+    return len(text) // 4
+
+
+def render(request_type, profile, recommended_foods=(), day_number=None, meal_name=None):
+    """
+    Render a prompt from the shared template family
+
+    Args:
+        request_type (str): 'full_week', 'single_day' or 'single_meal'
+        profile (dict): Profile from DietChartGenerator._extract_user_profile
+        recommended_foods (list): Food names to suggest to the model
+        day_number (int): Day to generate (single_day, single_meal)
+        meal_name (str): Meal slot to generate (single_meal)
+
+    Returns:
+        PromptParts: Static prefix and dynamic block
+
+    Raises:
+        ValueError: For unknown request types or meal slots
+    """
+    started = time.perf_counter()
+    if request_type not in _TASK_FORMATS:
+        raise ValueError(f"Unknown request type: {request_type}")
+    if request_type == 'single_meal' and meal_name not in MEAL_SLOTS:
+        raise ValueError(f"Unknown meal: {meal_name}. Must be one of {', '.join(MEAL_SLOTS)}")
+
+    avoid = list(profile['allergies']) + list(profile['disliked_foods'])
+    profile_block = _PROFILE_FORMAT.format(
+        dosha=profile['dosha'],
+        diet_type=profile['diet_type'],
+        avoid=_join(avoid, 'None'),
+        health_goals=_join(profile['health_goals'], 'General wellness'),
+        health_conditions=_join(profile['health_conditions'], 'None'),
+        age=profile['age'],
+        weight=profile['weight'],
+        activity_level=profile['activity_level'],
+        weight_goal=profile['weight_goal'] or 'Maintain',
+        recommended=_join(recommended_foods, 'Any suitable')
+    )
+    task = _TASK_FORMATS[request_type].format(
+        day_number=day_number,
+        day_name=DAY_NAMES[(int(day_number) - 1) % 7] if day_number else '',
+        meal_name=meal_name
+    )
+    dynamic = f"\nREQUEST TYPE: {request_type}\n{profile_block}\nTASK: {task}\n"
+    return PromptParts(request_type, STATIC_PREFIX, dynamic, time.perf_counter() - started)
+
+
+def _join(values, default):
+    return ', '.join(str(value) for value in values) if values else default
@@ -0,0 +1,217 @@
+"""
+structured_logging.py -
+Asynchronous Structured Logging Module
+Request threads only put log records on a bounded in-memory queue; a single
+background listener thread formats them as JSON lines and writes them to the
+sink, so a slow stdout never blocks request handling.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+
+# Request id of the request being handled on the current thread/context
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['requestId'] = request_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and key != 'request_id':
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp each record with the current request id on the calling thread"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records instead of blocking when the queue is full
+
+    Dropped records are counted and reported by the listener once it catches up.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock_dropped = threading.Lock()
+
+    def prepare(self, record):
+        # Resolve args and tracebacks on the caller's thread (they may not
+        # outlive it), but leave JSON encoding to the listener thread
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+
+    def take_dropped(self):
+        with self._lock_dropped:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class _DropReportingListener(logging.handlers.QueueListener):
+    """QueueListener that logs how many records were dropped under back-pressure"""
+
+    def __init__(self, log_queue, queue_handler, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+
+    def handle(self, record):
+        dropped = self.queue_handler.take_dropped()
+        if dropped:
+            notice = logging.LogRecord('structured_logging', logging.WARNING, __file__, 0,
+                                       'Log queue full; records dropped', (), None)
+            notice.dropped = dropped
+            super().handle(notice)
+        super().handle(record)
+
+
+class WarningSampler:
+    """
+    Collapses repetitive warnings into periodic aggregated records
+
+    The first occurrence of a key is logged immediately; later occurrences
+    within `interval` seconds are only counted. When the interval ends, a
+    timer logs the count with the latest occurrence's fields, so a burst's
+    count is reported even if the condition never recurs. Pending counts
+    are also flushed at interpreter exit.
+    """
+
+    def __init__(self, logger, interval=60.0):
+        """
+        Args:
+            logger (logging.Logger): Logger to emit sampled records on
+            interval (float): Minimum seconds between records for one key
+        """
+        self.logger = logger
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._state = {}   # key -> (last emit time, suppressed count, msg, fields)
+        self._timers = {}  # key -> pending flush timer
+        atexit.register(self.flush)
+
+    def warning(self, key, msg, **fields):
+        """
+        Log `msg` for `key` unless one was logged within the interval
+
+        Args:
+            key (str): Identity of the repetitive condition
+            msg (str): Message to log
+            **fields: Extra structured fields for the record
+        """
+        now = time.monotonic()
+        with self._lock:
+            last_emit, suppressed, _, _ = self._state.get(key, (None, 0, None, None))
+            if last_emit is not None and now - last_emit < self.interval:
+                self._state[key] = (last_emit, suppressed + 1, msg, fields)
+                if key not in self._timers:
+                    timer = threading.Timer(last_emit + self.interval - now, self._flush_key, (key,))
+                    timer.daemon = True
+                    self._timers[key] = timer
+                    timer.start()
+                return
+            self._state[key] = (now, 0, msg, fields)
+        self._emit(key, msg, fields, suppressed)
+
+    def flush(self):
+        """Log every pending suppressed count now"""
+        with self._lock:
+            keys = list(self._timers)
+        for key in keys:
+            self._flush_key(key)
+
+    def _flush_key(self, key):
+        with self._lock:
+            timer = self._timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+            last_emit, suppressed, msg, fields = self._state.get(key, (None, 0, None, None))
+            if not suppressed:
+                return
+            self._state[key] = (time.monotonic(), 0, msg, fields)
+        self._emit(key, msg, fields, suppressed)
+
+    def _emit(self, key, msg, fields, suppressed):
+        fields = dict(fields, sampleKey=key, suppressedCount=suppressed)
+        self.logger.warning(msg, extra=fields)
+
+
+def configure_logging(level=None, queue_size=10000, stream=None):
+    """
+    Route all logging through a bounded queue to a JSON stream handler
+
+    Args:
+        level (str): Log level name. Defaults to the LOG_LEVEL env var, then INFO.
+        queue_size (int): Maximum records buffered before new ones are dropped
+        stream: Output stream for the sink (defaults to stdout)
+
+    Returns:
+        logging.handlers.QueueListener: The running listener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+
+    sink = logging.StreamHandler(stream or sys.stdout)
+    sink.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    _listener = _DropReportingListener(log_queue, queue_handler, sink)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener